@@ -0,0 +1,286 @@
+#!/usr/bin/python3
+"""
+Micro-benchmarks for the hot paths of char_surface.
+
+OCR runs against a stub nhocr executable, so the suite works offline and
+measures this module's own overhead rather than recognition itself;
+--backend template swaps in the in-process template matcher instead.
+Results are emitted as JSON; pass a previous run to --compare to see the
+change per benchmark. Benchmarks of functions the checked-out
+char_surface lacks are skipped, so the script can be copied over older
+revisions to time them too.
+
+    python3 bench_cs.py -o before.json
+    python3 bench_cs.py -o after.json --compare before.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+from functools import partial
+
+import char_surface as cs
+
+STUB_NHOCR = """#!/bin/sh
+mode=$1
+shift 3
+if [ "$mode" = "-line" ]; then
+    echo "にの"
+    exit 0
+fi
+n=0
+for f in "$@"; do
+    printf 'IMG\\t%d\\nR\\t1\\tに\\t0\\t0\\t1.0\\n' $n
+    n=$((n + 1))
+done
+"""
+
+SHORT_TEXT = "しゅじ"
+LONG_TEXT = "わたしはわかりません、わたしがわかるのは"
+TILE_SIZES = (64, 100, 200)
+
+
+def write_stub_nhocr(directory):
+    # executable standing in for nhocr; answers -line and -mchar requests
+    stub = os.path.join(directory, "nhocr")
+    with open(stub, "w") as f:
+        f.write(STUB_NHOCR)
+    os.chmod(stub, 0o755)
+    return stub
+
+
+def available(*names):
+    # whether this revision of char_surface has all of names
+    return all(hasattr(cs, name) for name in names)
+
+
+def uncached_ocr(fn):
+    # every call pays for recognition, not an OCR_CACHE lookup
+    def run():
+        if available("OCR_CACHE"):
+            cs.OCR_CACHE.clear()
+        return fn()
+
+    return run
+
+
+def benchmarks(workdir):
+    """
+    Yield (name, callable) pairs; setup happens here, outside the timing.
+
+    :param workdir: scratch directory for PGM files
+    """
+    # revisions before the glyph cache always rasterize
+    uncached = {"use_cache": False} if available("GLYPH_CACHE") else {}
+
+    for size in TILE_SIZES:
+        font_size = int(size * 0.72)
+        glyph = ("じ", font_size, cs.FONT_PATH, cs.FONT_ALPHA, size, size)
+        yield f"draw_character[{size}]", partial(cs.draw_character, *glyph, **uncached)
+        if available("GLYPH_CACHE"):
+            yield f"draw_character_cached[{size}]", partial(cs.draw_character, *glyph)
+
+        for label, text in (("short", SHORT_TEXT), ("long", LONG_TEXT)):
+            for vertical in (False, True):
+                orientation = "v" if vertical else "h"
+                yield f"render_string[{label},{orientation},{size}]", partial(
+                    cs.render_string,
+                    text,
+                    render_vertically=vertical,
+                    font_size=font_size,
+                    tile_width=size,
+                    tile_height=size,
+                )
+
+    line = cs.render_string(SHORT_TEXT)
+    tile = cs.draw_character(
+        "じ",
+        cs.FONT_SIZE,
+        cs.FONT_PATH,
+        cs.FONT_ALPHA,
+        cs.TILE_WIDTH,
+        cs.TILE_HEIGHT,
+    )
+    line_pgm = os.path.join(workdir, "line.pgm")
+    tile_pgm = os.path.join(workdir, "tile.pgm")
+    cs.surface_to_pgm(line, line_pgm)
+    cs.surface_to_pgm(tile, tile_pgm)
+
+    yield "surface_to_pgm[line]", lambda: cs.surface_to_pgm(line, line_pgm)
+    yield "extract_rectangle", lambda: cs.extract_rectangle(
+        line, cs.TILE_WIDTH, 0, cs.TILE_WIDTH, cs.TILE_HEIGHT
+    )
+    if available("tile_view"):
+        yield "tile_view", lambda: cs.tile_view(
+            line, cs.TILE_WIDTH, 0, cs.TILE_WIDTH, cs.TILE_HEIGHT
+        )
+    yield "white_pixels_match", lambda: cs.white_pixels_match(tile, tile)
+    yield "find_tight_bounding_box", lambda: cs.find_tight_bounding_box(tile_pgm)
+    if available("tile_metrics"):
+        yield "tile_metrics[line]", lambda: cs.tile_metrics(line, len(SHORT_TEXT))
+    if available("read_pgm"):
+        yield "read_pgm[line]", lambda: cs.read_pgm(line_pgm)
+        yield "read_pgm_surface[line]", lambda: cs.read_pgm(line_pgm, as_surface=True)
+    if available("_pgm_to_inverted_argb32"):
+        yield "pgm_to_inverted_argb32[line]", lambda: cs._pgm_to_inverted_argb32(
+            line_pgm
+        )
+
+    # surfaces are only accepted once ocr reads from memory
+    char = tile if available("_ocr_input") else tile_pgm
+    yield "ocr[line]", uncached_ocr(lambda: cs.ocr(line_pgm))
+    yield "ocr[char]", uncached_ocr(lambda: cs.ocr(char, single_char_reading=True))
+    yield "ocr[fallback]", uncached_ocr(
+        lambda: cs.ocr(line_pgm, known_translation=SHORT_TEXT)
+    )
+    if available("ocr_tiles"):
+        yield "evaluate_line", uncached_ocr(
+            lambda: cs.ocr_tiles(line, tile_count=len(SHORT_TEXT))
+        )
+    if available("ocr_tiles", "OCR_CACHE"):
+        yield "evaluate_line_cached", lambda: cs.ocr_tiles(
+            line, tile_count=len(SHORT_TEXT)
+        )
+
+
+def measure(fn, rounds, min_time):
+    """
+    Time fn, returning seconds per call for each round.
+
+    :param fn: callable to benchmark
+    :param rounds: number of timed rounds
+    :param min_time: seconds each round should last at least
+    """
+    timer = timeit.Timer(fn)
+    number = 1
+    while timer.timeit(number) < min_time:
+        number *= 2
+    return [t / number for t in timer.repeat(rounds, number)], number
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL,
+            universal_newlines=True,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(selected=None, rounds=5, min_time=0.05, backend=None):
+    """
+    Run the benchmarks and return the results as a JSON-ready dict.
+
+    :param selected: substrings; only benchmarks whose name holds one run
+    :param rounds: number of timed rounds per benchmark
+    :param min_time: seconds each round should last at least
+    :param backend: OCR backend name; the stub nhocr is used if omitted
+    """
+    if backend and not available("set_ocr_backend"):
+        raise ValueError("this revision of char_surface has no OCR backends")
+
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        # older revisions run whichever nhocr is first on PATH
+        stub = write_stub_nhocr(workdir)
+        search_path = os.environ.get("PATH", "")
+        os.environ["PATH"] = workdir + os.pathsep + search_path
+        nhocr_command = getattr(cs, "NHOCR_COMMAND", None)
+        if available("NHOCR_COMMAND"):
+            cs.NHOCR_COMMAND = stub
+        previous = cs.set_ocr_backend(backend) if backend else None
+        try:
+            for name, fn in benchmarks(workdir):
+                if selected and not any(s in name for s in selected):
+                    continue
+                times, number = measure(fn, rounds, min_time)
+                results[name] = {
+                    "min": min(times),
+                    "median": statistics.median(times),
+                    "mean": statistics.mean(times),
+                    "rounds": rounds,
+                    "number": number,
+                }
+                print(
+                    f"{name:40} {results[name]['median'] * 1e6:12.1f} us",
+                    file=sys.stderr,
+                )
+        finally:
+            os.environ["PATH"] = search_path
+            if available("NHOCR_COMMAND"):
+                cs.NHOCR_COMMAND = nhocr_command
+            if previous is not None:
+                cs.set_ocr_backend(previous)
+
+    return {
+        "revision": git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "backend": backend or "nhocr",
+        "results": results,
+    }
+
+
+def compare(baseline, current):
+    """
+    Format the median of each benchmark against a baseline run.
+
+    :param baseline: results dict from an earlier run
+    :param current: results dict from this run
+    """
+    lines = [f"{'benchmark':40} {'before us':>12} {'after us':>12} {'change':>8}"]
+    for name, result in current["results"].items():
+        before = baseline["results"].get(name)
+        after = result["median"] * 1e6
+        if before is None:
+            lines.append(f"{name:40} {'-':>12} {after:12.1f} {'new':>8}")
+            continue
+        before = before["median"] * 1e6
+        lines.append(
+            f"{name:40} {before:12.1f} {after:12.1f} {after / before - 1:+8.1%}"
+        )
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "-o", "--output", help="write JSON results here instead of stdout"
+    )
+    parser.add_argument("--compare", help="JSON results of a baseline run")
+    parser.add_argument(
+        "-k",
+        "--select",
+        action="append",
+        help="only run benchmarks whose name contains this; repeatable",
+    )
+    parser.add_argument(
+        "--backend", choices=["nhocr", "template"], help="OCR backend to time"
+    )
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--min-time", type=float, default=0.05)
+    args = parser.parse_args()
+
+    current = run(args.select, args.rounds, args.min_time, args.backend)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(current, f, indent=2)
+    else:
+        json.dump(current, sys.stdout, indent=2)
+        print()
+
+    if args.compare:
+        with open(args.compare) as f:
+            print(compare(json.load(f), current), file=sys.stderr)
@@ -1,4 +1,9 @@
+import abc
 import cairo
+import os
+import threading
+from collections import OrderedDict, namedtuple
+from contextlib import contextmanager
 
 # MODULE CONSTANTS
 FONT_SIZE = 72
@@ -7,6 +12,326 @@ FONT_PATH = "/usr/share/fonts/google-droid-sans-fonts/DroidSansJapanese.ttf"
 RULES = [20, 80]
 TILE_WIDTH = 100
 TILE_HEIGHT = 100
+GLYPH_CACHE_BYTES = 64 * 1024 * 1024  # pixel budget for cached glyph tiles
+RENDER_ENGINE = "pil"  # glyph rasterizer: "pil" or "cairo"
+NHOCR_COMMAND = "nhocr"
+# RAM-backed scratch space for nhocr input files, when the host has one
+OCR_TEMP_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else None
+OCR_WORKERS = os.cpu_count() or 1  # concurrent nhocr processes in ocr_batch
+OCR_IMAGES_PER_PROCESS = 8  # single-character tiles recognized per nhocr run
+OCR_CACHE_ENTRIES = 4096  # nhocr readings kept in memory by OCR_CACHE
+PGM_CHUNK_PIXELS = 1 << 18  # pixels converted at a time by the PGM encoder
+_LUMA_WEIGHTS = (19595, 38470, 7471)  # BT.601 R, G, B weights in 16.16 fixed point
+STROKE_MIN_DISTANCE = 1.5  # px a pen must travel before another point is kept
+STROKE_EPSILON = 0.5  # px tolerance when simplifying a finished stroke
+
+# text is the reading, or None when error holds what went wrong
+OcrResult = namedtuple("OcrResult", ["text", "error"])
+# ink bounding box, share of the tile it covers, and "small"/"large"
+TileMetrics = namedtuple("TileMetrics", ["bbox", "proportion", "size"])
+
+
+class GlyphCache:
+    """
+    Bounded LRU cache of rendered glyph tiles.
+
+    Entries are keyed by everything that affects the rasterized tile
+    (character, font, size, alpha and tile dimensions), and the cache
+    evicts the least recently used tiles once the pixel data held
+    exceeds max_bytes.
+
+    Cached surfaces are shared by every caller that asks for the same
+    glyph, so they must be treated as read-only: composite them onto
+    another surface rather than drawing into them.
+
+    :param max_bytes: upper bound on the bytes of pixel data retained
+    """
+
+    def __init__(self, max_bytes=GLYPH_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """
+        Return the cached surface for key, or None on a miss.
+
+        :param key: glyph key tuple
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, surface):
+        """
+        Store a surface under key, evicting older tiles to stay in budget.
+
+        :param key: glyph key tuple
+        :param surface: A cairo.ImageSurface object.
+        """
+        size = surface.get_stride() * surface.get_height()
+        with self._lock:
+            if key in self._entries:
+                self.current_bytes -= self._entries.pop(key)[1]
+            if size > self.max_bytes:
+                return  # would never fit; don't flush the cache for it
+            self._entries[key] = (surface, size)
+            self.current_bytes += size
+            self._evict()
+
+    def resize(self, max_bytes):
+        """
+        Change the byte budget, evicting immediately if it shrank.
+
+        :param max_bytes: new upper bound on retained pixel data
+        """
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def clear(self):
+        """
+        Drop every cached tile and reset the counters.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        """
+        Return a dictionary of cache counters.
+        """
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def _evict(self):
+        # caller holds the lock
+        while self.current_bytes > self.max_bytes and self._entries:
+            _, (_, size) = self._entries.popitem(last=False)
+            self.current_bytes -= size
+            self.evictions += 1
+
+
+GLYPH_CACHE = GlyphCache()
+
+_FONT_REGISTRY = {}
+_FONT_REGISTRY_LOCK = threading.Lock()
+_FONT_LOCKS = {}  # (font_path, font_size) -> lock held while a face is in use
+
+
+def load_font(font_path=FONT_PATH, font_size=FONT_SIZE):
+    """
+    Return a PIL font face for the path and size, loading it only once.
+
+    Faces are kept in a module registry so the (multi-megabyte) CJK
+    font file is parsed once per size rather than once per character.
+    A face is shared by every thread, so use it under font_lock().
+
+    :param font_path: absolute path to requested font TTF file
+    :param font_size: the font size
+    """
+    from PIL import ImageFont
+
+    key = (font_path, font_size)
+    font = _FONT_REGISTRY.get(key)
+    if font is None:
+        with _FONT_REGISTRY_LOCK:
+            font = _FONT_REGISTRY.get(key)
+            if font is None:
+                font = ImageFont.truetype(font_path, font_size)
+                _FONT_LOCKS[key] = threading.Lock()
+                _FONT_REGISTRY[key] = font
+    return font
+
+
+def font_lock(font_path=FONT_PATH, font_size=FONT_SIZE):
+    """
+    Return the lock serializing use of load_font's face for the path
+    and size; FreeType faces must not be used by two threads at once.
+
+    :param font_path: absolute path to requested font TTF file
+    :param font_size: the font size
+    """
+    load_font(font_path, font_size)
+    return _FONT_LOCKS[(font_path, font_size)]
+
+
+def preload_fonts(font_sizes, font_path=FONT_PATH):
+    """
+    Load every requested size of a font into the registry up front,
+    so the first rendered line doesn't pay for parsing the font file.
+
+    :param font_sizes: iterable of font sizes the app will render at
+    :param font_path: absolute path to requested font TTF file
+    """
+    for font_size in font_sizes:
+        load_font(font_path, font_size)
+
+
+class OcrCache:
+    """
+    Content-addressed cache of nhocr output.
+
+    Readings are keyed by a hash of the image's PGM bytes together with
+    the recognition mode and recognizer, so identical tiles are only
+    ever recognized once. An in-memory LRU sits in front of an optional
+    sqlite file that persists readings across sessions.
+
+    :param max_entries: readings kept in memory
+    :param path: sqlite database file for the persistent tier, if any
+    """
+
+    def __init__(self, max_entries=OCR_CACHE_ENTRIES, path=None):
+        self.max_entries = max_entries
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if path:
+            self.open_disk(path)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def key(self, data, mode, backend=None):
+        """
+        Return the cache key for an image.
+
+        :param data: the image's PGM bytes
+        :param mode: "-line" or "-mchar"
+        :param backend: the OcrBackend reading it; defaults to OCR_BACKEND
+        """
+        import hashlib
+
+        backend = get_ocr_backend(backend)
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(f"{backend.cache_id}\0{mode}\0".encode())
+        digest.update(data)
+        return digest.hexdigest()
+
+    def open_disk(self, path):
+        """
+        Attach (creating if needed) a sqlite file as the persistent tier.
+
+        :param path: sqlite database file
+        """
+        import sqlite3
+
+        db = sqlite3.connect(path, check_same_thread=False)
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS readings (key TEXT PRIMARY KEY, output TEXT)"
+        )
+        db.commit()
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+            self._db = db
+
+    def close_disk(self):
+        """
+        Detach the persistent tier, keeping the in-memory readings.
+        """
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def get(self, key):
+        """
+        Return the cached output for key, or None on a miss.
+
+        :param key: a key from OcrCache.key
+        """
+        with self._lock:
+            output = self._entries.get(key)
+            if output is not None:
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                return output
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT output FROM readings WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    self.disk_hits += 1
+                    self._remember(key, row[0])
+                    return row[0]
+
+            self.misses += 1
+            return None
+
+    def put(self, key, output):
+        """
+        Store nhocr output under key in every tier.
+
+        :param key: a key from OcrCache.key
+        :param output: raw nhocr output text
+        """
+        with self._lock:
+            self._remember(key, output)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO readings (key, output) VALUES (?, ?)",
+                    (key, output),
+                )
+                self._db.commit()
+
+    def clear(self):
+        """
+        Drop the in-memory readings and reset the counters; the
+        persistent tier is left untouched.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.memory_hits = self.disk_hits = self.misses = 0
+
+    def stats(self):
+        """
+        Return a dictionary of cache counters, including the hit rate.
+        """
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            hits = self.memory_hits + self.disk_hits
+            return {
+                "entries": len(self._entries),
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": hits / lookups if lookups else 0.0,
+            }
+
+    def _remember(self, key, output):
+        # caller holds the lock
+        self._entries[key] = output
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+OCR_CACHE = OcrCache()
 
 
 def is_pixel_white(surface, x, y):
@@ -121,6 +446,63 @@ def apply_bounding_box(surface, x_offset=0, y_offset=0):
     return surface
 
 
+_GUIDE_PATTERNS = {}
+_GUIDE_PATTERNS_LOCK = threading.Lock()
+
+
+def guide_pattern(
+    tile_width=TILE_WIDTH, tile_height=TILE_HEIGHT, rules=RULES, bounding_box=False
+):
+    """
+    Return a repeating cairo pattern holding one tile's worth of guides.
+
+    The guides are drawn once onto a transparent tile per distinct
+    (tile size, rules, bounding box) and cached; the pattern repeats in
+    both directions, so it serves horizontal and vertical lines alike.
+
+    :param tile_width: width of each individual tile
+    :param tile_height: height of each individual tile
+    :param rules: y-coordinates of the horizontal rules within a tile
+    :param bounding_box: also draw the apply_bounding_box frame
+    """
+    key = (tile_width, tile_height, tuple(rules), bounding_box)
+    with _GUIDE_PATTERNS_LOCK:
+        pattern = _GUIDE_PATTERNS.get(key)
+        if pattern is None:
+            tile = cairo.ImageSurface(cairo.FORMAT_ARGB32, tile_width, tile_height)
+            apply_horizontal_rule(tile, rules=rules)
+            if bounding_box:
+                apply_bounding_box(tile)
+
+            pattern = cairo.SurfacePattern(tile)
+            pattern.set_extend(cairo.EXTEND_REPEAT)
+            _GUIDE_PATTERNS[key] = pattern
+    return pattern
+
+
+def apply_guides(
+    surface,
+    tile_width=TILE_WIDTH,
+    tile_height=TILE_HEIGHT,
+    rules=RULES,
+    bounding_box=False,
+):
+    """
+    Paint the tile guides across an entire surface in a single operation,
+    whatever the number of tiles, and return the surface back.
+
+    :param surface: A cairo.ImageSurface object.
+    :param tile_width: width of each individual tile
+    :param tile_height: height of each individual tile
+    :param rules: y-coordinates of the horizontal rules within a tile
+    :param bounding_box: also draw the apply_bounding_box frame
+    """
+    ctx = cairo.Context(surface)
+    ctx.set_source(guide_pattern(tile_width, tile_height, rules, bounding_box))
+    ctx.paint()
+    return surface
+
+
 def draw_character(
     char,
     font_size=FONT_SIZE,
@@ -128,42 +510,80 @@ def draw_character(
     font_alpha=FONT_ALPHA,
     tile_width=TILE_WIDTH,
     tile_height=TILE_HEIGHT,
+    use_cache=True,
+    engine=None,
 ):
     """
     Draw a character on a fully transparent surface and return it.
 
+    Tiles are served from GLYPH_CACHE when possible; a cached tile is
+    shared, so callers must not draw into the returned surface.
+
     :param char: the character to draw
+    :param use_cache: look up and store the tile in GLYPH_CACHE
+    :param engine: "pil" or "cairo"; defaults to RENDER_ENGINE
     """
-    from PIL import Image, ImageDraw, ImageFont
-    import numpy as np
-    import cairo
+    engine = engine or RENDER_ENGINE
+    if engine == "pil":
+        rasterize = _rasterize_character
+    elif engine == "cairo":
+        rasterize = _rasterize_character_cairo
+    else:
+        raise ValueError(f"Unknown render engine: {engine}")
 
-    def calculate_centering_offset(object_size):
-        # Define offsets based on object size ranges
-        if object_size <= 18:
-            offset = 2
-        elif object_size <= 36:
-            offset = 5
-        elif object_size <= 72:
-            offset = 10
-        else:
-            # For sizes greater than 72
-            offset = 15  # Default to 10
+    key = (char, font_path, font_size, font_alpha, tile_width, tile_height, engine)
+    if use_cache:
+        surface = GLYPH_CACHE.get(key)
+        if surface is not None:
+            return surface
+
+    surface = rasterize(char, font_size, font_path, font_alpha, tile_width, tile_height)
+
+    if use_cache:
+        GLYPH_CACHE.put(key, surface)
+    return surface
+
+
+def _centering_offset(object_size):
+    # Define offsets based on object size ranges
+    if object_size <= 18:
+        offset = 2
+    elif object_size <= 36:
+        offset = 5
+    elif object_size <= 72:
+        offset = 10
+    else:
+        # For sizes greater than 72
+        offset = 15  # Default to 10
 
-        return offset
+    return offset
+
+
+def _rasterize_character(
+    char, font_size, font_path, font_alpha, tile_width, tile_height
+):
+    """
+    Rasterize a single character tile with PIL, bypassing the cache.
+
+    :param char: the character to draw
+    """
+    from PIL import Image, ImageDraw
+    import numpy as np
+    import cairo
 
     # Step 1: Draw the character on a transparent background
     image = Image.new(
         "RGBA", (tile_width, tile_height), (0, 0, 0, 0)
     )  # Use fully transparent background
     draw = ImageDraw.Draw(image)
-    font = ImageFont.truetype(font_path, font_size)
-    draw.text(
-        (calculate_centering_offset(font_size), 0),
-        char,
-        fill=(0, 0, 0, font_alpha),
-        font=font,
-    )  # Draw the text in white with semi-opacity for better contrast in grayscale conversion
+    font = load_font(font_path, font_size)
+    with font_lock(font_path, font_size):
+        draw.text(
+            (_centering_offset(font_size), 0),
+            char,
+            fill=(0, 0, 0, font_alpha),
+            font=font,
+        )  # Draw the text in white with semi-opacity for better contrast in grayscale conversion
 
     # Step 2: Convert the image to grayscale while preserving alpha
     gray_image = image.convert("LA")
@@ -184,6 +604,77 @@ def draw_character(
     return surface
 
 
+def _rasterize_character_cairo(
+    char, font_size, font_path, font_alpha, tile_width, tile_height
+):
+    """
+    Rasterize a single character tile straight into a cairo ARGB32
+    surface, bypassing the cache.
+
+    cairo writes premultiplied alpha itself, so there are no PIL or numpy
+    intermediates. pycairo cannot open a font file directly, so the face
+    is selected by the family name read from the font file. fontconfig
+    substitutes another font for a family that isn't installed, so when
+    the family doesn't resolve back to font_path the tile is drawn with
+    PIL instead.
+
+    :param char: the character to draw
+    """
+    with font_lock(font_path, font_size):
+        family = load_font(font_path, font_size).getname()[0]
+    if not _cairo_resolves_font(family, font_path):
+        return _rasterize_character(
+            char, font_size, font_path, font_alpha, tile_width, tile_height
+        )
+
+    surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, tile_width, tile_height)
+    ctx = cairo.Context(surface)
+    ctx.select_font_face(family, cairo.FONT_SLANT_NORMAL, cairo.FONT_WEIGHT_NORMAL)
+    ctx.set_font_size(font_size)
+
+    # PIL anchors text at the ascender line; cairo draws from the baseline
+    ascent = ctx.font_extents()[0]
+    ctx.move_to(_centering_offset(font_size), ascent)
+    ctx.set_source_rgba(0, 0, 0, font_alpha / 255.0)
+    ctx.show_text(char)
+    surface.flush()
+
+    return surface
+
+
+_CAIRO_FONT_FILES = {}  # family -> file fontconfig resolves it to, or None
+
+
+def _cairo_resolves_font(family, font_path):
+    """
+    Return whether cairo, selecting a face by family name, gets the face
+    in font_path rather than a fontconfig substitute.
+
+    The answer comes from fc-match and is remembered per family; if
+    fc-match can't be run it is False, so callers fall back to PIL.
+
+    :param family: font family name, as read from font_path
+    :param font_path: absolute path to requested font TTF file
+    """
+    import subprocess
+
+    if family not in _CAIRO_FONT_FILES:
+        try:
+            resolved = subprocess.check_output(
+                ["fc-match", "--format=%{file}", family],
+                stderr=subprocess.DEVNULL,
+                universal_newlines=True,
+            ).strip()
+        except (OSError, subprocess.CalledProcessError):
+            resolved = None
+        _CAIRO_FONT_FILES[family] = resolved
+
+    resolved = _CAIRO_FONT_FILES[family]
+    return resolved is not None and (
+        os.path.realpath(resolved) == os.path.realpath(font_path)
+    )
+
+
 def stack_surfaces(base_layer, top_layer, x_offset=0, y_offset=0):
     """
     Stack two surfaces atop another.
@@ -209,6 +700,8 @@ def render_string(
     font_alpha=FONT_ALPHA,
     tile_width=TILE_WIDTH,
     tile_height=TILE_HEIGHT,
+    use_cache=True,
+    engine=None,
 ):
     """
     Render a surface with a string of characters against a white bg.
@@ -219,6 +712,8 @@ def render_string(
     :param font_alpha: alpha channel value of the text
     :param tile_width: width of each individual tile
     :param tile_height: height of each individual tile
+    :param use_cache: reuse glyph tiles from GLYPH_CACHE
+    :param engine: glyph rasterizer, "pil" or "cairo"
     """
     tiles = [
         draw_character(
@@ -228,26 +723,102 @@ def render_string(
             font_alpha=font_alpha,
             tile_width=tile_width,
             tile_height=tile_height,
+            use_cache=use_cache,
+            engine=engine,
         )
         for c in text_str
     ]
 
+    return composite_tiles(
+        tiles, tile_width, tile_height, render_vertically=render_vertically
+    )
+
+
+def surface_array(surface):
+    """
+    Return a (height, width, 4) uint8 numpy view of an ARGB32 surface.
+
+    The view shares memory with the surface and honors its stride, so
+    any row padding is skipped rather than copied. Channels are in
+    memory order (B, G, R, A on little-endian hosts).
+
+    :param surface: A cairo.ImageSurface object.
+    """
+    import numpy as np
+
+    surface.flush()
+    width, height = surface.get_width(), surface.get_height()
+    return np.ndarray(
+        shape=(height, width, 4),
+        dtype=np.uint8,
+        buffer=surface.get_data(),
+        strides=(surface.get_stride(), 4, 1),
+    )
+
+
+def composite_tiles(
+    tiles,
+    tile_width=TILE_WIDTH,
+    tile_height=TILE_HEIGHT,
+    render_vertically=False,
+    background_color=(255, 255, 255),
+):
+    """
+    Composite equally sized tiles onto one opaque background in a single
+    batched numpy OVER operation, instead of one cairo paint per tile.
+
+    The returned surface wraps the numpy buffer the tiles were written
+    into, so no further copy is made, and tile_view can slice it again
+    without copying.
+
+    :param tiles: list of ARGB32 cairo.ImageSurface tiles, in reading order
+    :param tile_width: width of each individual tile
+    :param tile_height: height of each individual tile
+    :param render_vertically: stack tiles top to bottom instead of left to right
+    :param background_color: The RGB background color under the tiles.
+    """
+    import numpy as np
+
+    count = len(tiles)
+    if count == 0:
+        width, height = (tile_width, 0) if render_vertically else (0, tile_height)
+        return create_blank(cairo.FORMAT_ARGB32, width, height)
+
     if render_vertically:
-        surface = create_blank(
-            cairo.FORMAT_ARGB32, tile_width, tile_height * len(tiles)
-        )
+        width, height = tile_width, tile_height * count
+    else:
+        width, height = tile_width * count, tile_height
 
-        for i, tile in enumerate(tiles):
-            surface = stack_surfaces(surface, tile, y_offset=tile_height * i)
-    else:  # horizontal rendering default
-        surface = create_blank(
-            cairo.FORMAT_ARGB32, tile_width * len(tiles), tile_height
-        )
+    stride = cairo.ImageSurface.format_stride_for_width(cairo.FORMAT_ARGB32, width)
+    buffer = _slack_buffer(stride, height)  # tile_view can slice it later
+
+    # a (count, tile_height, tile_width, 4) window onto the line buffer
+    if render_vertically:
+        tile_strides = (tile_height * stride, stride, 4, 1)
+    else:
+        tile_strides = (tile_width * 4, stride, 4, 1)
+    dest = np.ndarray(
+        shape=(count, tile_height, tile_width, 4),
+        dtype=np.uint8,
+        buffer=buffer,
+        strides=tile_strides,
+    )
 
-        for i, tile in enumerate(tiles):
-            surface = stack_surfaces(surface, tile, x_offset=tile_width * i)
+    for tile in tiles:
+        if tile.get_width() != tile_width or tile.get_height() != tile_height:
+            raise ValueError("All tiles must match tile_width and tile_height.")
+    src = np.stack([surface_array(tile) for tile in tiles]).astype(np.uint16)
 
-    return surface
+    # premultiplied OVER an opaque background, rounded the way pixman does:
+    # dst = src + bg * (255 - src_alpha) / 255
+    r, g, b = background_color
+    background = np.array([b, g, r, 255], dtype=np.uint16)
+    blend = background * (255 - src[..., 3:4]) + 128
+    dest[...] = src + ((blend + (blend >> 8)) >> 8)
+
+    return cairo.ImageSurface.create_for_data(
+        buffer, cairo.FORMAT_ARGB32, width, height, stride
+    )
 
 
 def extract_rectangle(original_surface, x, y, rect_width, rect_height):
@@ -271,6 +842,166 @@ def extract_rectangle(original_surface, x, y, rect_width, rect_height):
     return new_surface
 
 
+def _copy_rectangle(surface, x, y, rect_width, rect_height):
+    # extract_rectangle, but into a surface of the source's own format
+    copy = cairo.ImageSurface(surface.get_format(), rect_width, rect_height)
+    ctx = cairo.Context(copy)
+    ctx.set_source_surface(surface, -x, -y)
+    ctx.paint()
+    return copy
+
+
+_SLACK_BUFFERS = {}  # data address -> weakref to a buffer with a slack row
+
+
+def _slack_buffer(stride, height, clear=False):
+    """
+    Allocate the uint8 buffer for a surface of height rows, plus one
+    slack row past its end.
+
+    pycairo only wraps buffers of at least height * stride bytes, so a
+    view of a tile that starts right of x = 0 in the bottom rows needs
+    memory past the surface's last row; the slack row provides it. The
+    buffer is registered so tile_view can find it from the surface.
+
+    Only the slack row is zeroed unless clear is set; callers that
+    write every pixel of the surface skip the memset of the rest.
+
+    :param stride: bytes per row
+    :param height: rows in the surface
+    :param clear: zero the surface rows too, leaving it transparent
+    """
+    import weakref
+    import numpy as np
+
+    if clear:
+        buffer = np.zeros((height + 1) * stride, dtype=np.uint8)
+    else:
+        buffer = np.empty((height + 1) * stride, dtype=np.uint8)
+        buffer[height * stride :] = 0
+    address = buffer.ctypes.data
+
+    def forget(ref):
+        if _SLACK_BUFFERS.get(address) is ref:
+            del _SLACK_BUFFERS[address]
+
+    _SLACK_BUFFERS[address] = weakref.ref(buffer, forget)
+    return buffer
+
+
+def tile_view(surface, x, y, rect_width, rect_height):
+    """
+    Return a rectangle of a surface as a surface sharing its pixels.
+
+    The view wraps the parent's own buffer at the rectangle's offset,
+    with the parent's stride, so nothing is copied; drawing into either
+    shows in both. Surfaces made by this module (render_string,
+    composite_tiles, a8_to_inverted_argb32, create_line_surface) carry
+    a slack row, so any rectangle inside them can be viewed. Otherwise,
+    or for rectangles reaching outside the surface or, on A8 surfaces,
+    starting at an x that isn't a multiple of 4, the rectangle is copied
+    into a new surface instead. Either way the result has the format of
+    the surface.
+
+    :param surface: an ARGB32, RGB24 or A8 cairo.ImageSurface
+    :param x: x offset of the rectangle
+    :param y: y offset of the rectangle
+    :param rect_width: width of the rectangle
+    :param rect_height: height of the rectangle
+    """
+    import numpy as np
+
+    pixel_bytes = {
+        cairo.FORMAT_ARGB32: 4,
+        cairo.FORMAT_RGB24: 4,
+        cairo.FORMAT_A8: 1,
+    }.get(surface.get_format())
+    inside = (
+        0 <= x
+        and 0 <= y
+        and rect_width > 0
+        and rect_height > 0
+        and x + rect_width <= surface.get_width()
+        and y + rect_height <= surface.get_height()
+    )
+    if pixel_bytes is None or not inside:
+        return _copy_rectangle(surface, x, y, rect_width, rect_height)
+
+    surface.flush()
+    stride = surface.get_stride()
+    data = np.frombuffer(surface.get_data(), dtype=np.uint8)
+    ref = _SLACK_BUFFERS.get(data.ctypes.data)
+    buffer = ref() if ref is not None else None
+    if buffer is None:
+        buffer = data  # no slack: views ending on the last row start at x = 0
+
+    offset = y * stride + x * pixel_bytes
+    # cairo wants row starts 4-byte aligned, and the rows must fit the buffer
+    if offset % 4 or offset + rect_height * stride > len(buffer):
+        return _copy_rectangle(surface, x, y, rect_width, rect_height)
+    return cairo.ImageSurface.create_for_data(
+        buffer[offset : offset + rect_height * stride],
+        surface.get_format(),
+        rect_width,
+        rect_height,
+        stride,
+    )
+
+
+def tile_array(surface, x, y, rect_width, rect_height):
+    """
+    Return a rectangle of an ARGB32 surface as a (height, width, 4) uint8
+    numpy view of its pixels; see surface_array.
+
+    :param surface: an ARGB32 cairo.ImageSurface
+    :param x: x offset of the rectangle
+    :param y: y offset of the rectangle
+    :param rect_width: width of the rectangle
+    :param rect_height: height of the rectangle
+    """
+    return surface_array(surface)[y : y + rect_height, x : x + rect_width]
+
+
+def create_line_surface(width, height):
+    """
+    Create a blank (transparent) ARGB32 surface that tile_view can slice
+    into views at any position.
+
+    :param width: surface width
+    :param height: surface height
+    """
+    stride = cairo.ImageSurface.format_stride_for_width(cairo.FORMAT_ARGB32, width)
+    return cairo.ImageSurface.create_for_data(
+        _slack_buffer(stride, height, clear=True),
+        cairo.FORMAT_ARGB32,
+        width,
+        height,
+        stride,
+    )
+
+
+def tile_rectangles(width, height, tile_count=None, render_vertically=None):
+    """
+    Split a line of tiles into (x, y, width, height) rectangles.
+
+    :param width: width of the whole line surface
+    :param height: height of the whole line surface
+    :param tile_count: number of tiles; square tiles are assumed if omitted
+    :param render_vertically: tiles run top to bottom; inferred if omitted
+    """
+    if render_vertically is None:
+        render_vertically = height > width
+
+    if render_vertically:  # vertical writing
+        tile_count = tile_count or int(height / width)
+        tile_height = int(height / tile_count)
+        return [(0, i * tile_height, width, tile_height) for i in range(tile_count)]
+    else:  # horizontal
+        tile_count = tile_count or int(width / height)
+        tile_width = int(width / tile_count)
+        return [(i * tile_width, 0, tile_width, height) for i in range(tile_count)]
+
+
 def white_pixels_match(surface1, surface2):
     """
     Check that an image shares all the same white pixels.
@@ -309,234 +1040,989 @@ def white_pixels_match(surface1, surface2):
     return np.array_equal(white1, white2)
 
 
-def surface_to_pgm(surface, filepath, background_color=(255, 255, 255)):
+def a8_to_inverted_argb32(source):
     """
-    Saves a cairo.ImageSurface to a binary PGM file, incorporating alpha blending.
+    Convert 8-bit grayscale data into an opaque ARGB32 surface.
 
-    :param surface: The Cairo ImageSurface to save.
-    :param filepath: The output filepath for the PGM file.
-    :param background_color: The RGB background color for alpha blending.
+    Each value is treated as the alpha of white laid over a black
+    background, so a value of v becomes the gray pixel (v, v, v). The
+    whole image is converted in one numpy operation.
+
+    :param source: a cairo.FORMAT_A8 ImageSurface or a 2D uint8 array
+    :return: A new cairo.ImageSurface containing the image data.
     """
     import numpy as np
 
-    surface.flush()  # Ensure all drawing operations are flushed
-    width, height = surface.get_width(), surface.get_height()
-    data = surface.get_data()
-
-    # Convert the data to a Numpy array (shape: height x width x 4)
-    arr = np.ndarray(shape=(height, width, 4), dtype=np.uint8, buffer=data)
+    if isinstance(source, cairo.ImageSurface):
+        source.flush()
+        height, width = source.get_height(), source.get_width()
+        a8_data = np.ndarray(
+            shape=(height, width),
+            dtype=np.uint8,
+            buffer=source.get_data(),
+            strides=(source.get_stride(), 1),
+        )
+    else:
+        a8_data = np.asarray(source, dtype=np.uint8)
+        height, width = a8_data.shape
 
-    # Normalize alpha values to range [0, 1]
-    alpha = arr[:, :, 3] / 255.0
-    # Expand dimensions of alpha for broadcasting
-    alpha_expanded = alpha[:, :, np.newaxis]
+    stride = cairo.ImageSurface.format_stride_for_width(cairo.FORMAT_ARGB32, width)
+    buffer = _slack_buffer(stride, height)
+    argb32_data = buffer.view(np.uint32).reshape(height + 1, stride // 4)
+    argb32_data[:height, :width] = 0xFF000000 | a8_data.astype(np.uint32) * 0x010101
 
-    # Perform alpha blending: pixel = alpha * pixel + (1 - alpha) * background
-    blended = alpha_expanded * arr[:, :, :3] + (1 - alpha_expanded) * np.array(
-        background_color
+    return cairo.ImageSurface.create_for_data(
+        buffer, cairo.FORMAT_ARGB32, width, height, stride
     )
 
-    # Convert blended RGB to grayscale using luminosity method
-    grayscale = (
-        0.299 * blended[:, :, 0] + 0.587 * blended[:, :, 1] + 0.114 * blended[:, :, 2]
-    ).astype(np.uint8)
 
-    with open(filepath, "wb") as f:
-        # Write the binary PGM header
-        f.write(bytearray(f"P5\n{width} {height}\n255\n", "ascii"))
+def _grayscale_chunks(surface, background_color, out=None):
+    """
+    Flatten an ARGB32 or RGB24 surface onto a background and yield its
+    luminosity a few rows at a time, as (first row, uint8 rows) pairs.
 
-        # Write the grayscale data as binary
-        grayscale.tofile(f)
+    Integer fixed-point math is used throughout: alpha is premultiplied,
+    so compositing is c + (255 - a) * background / 255, and the BT.601
+    luma weights are scaled by 1 << 16. Only PGM_CHUNK_PIXELS worth of
+    rows is converted at once, so the temporaries stay small however
+    large the surface is. The surface's stride is honored.
 
+    :param surface: The Cairo ImageSurface to convert.
+    :param background_color: The RGB background color for alpha blending.
+    :param out: (height, width) uint8 array to write the rows into; when
+        omitted, the yielded rows are a buffer reused for the next chunk
+    """
+    import numpy as np
 
-def ocr(
-    filepath, single_char_reading=False, known_translation=None, render_vertically=False
-):
+    format = surface.get_format()
+    if format not in (cairo.FORMAT_ARGB32, cairo.FORMAT_RGB24):
+        raise ValueError(f"Unsupported surface format for grayscale: {format}")
+
+    pixels = surface_array(surface)  # B, G, R, A
+    height, width = pixels.shape[:2]
+    weight_r, weight_g, weight_b = (np.uint32(w) for w in _LUMA_WEIGHTS)
+
+    # the background's share of each output pixel, by alpha
+    red, green, blue = background_color
+    background = int(weight_r) * red + int(weight_g) * green + int(weight_b) * blue
+    coverage = 255 - np.arange(256, dtype=np.uint32)
+    background_share = (coverage * background + 127) // 255
+
+    rows = max(1, min(height, PGM_CHUNK_PIXELS // max(width, 1)))
+    luma = np.empty((rows, width), dtype=np.uint32)
+    term = np.empty((rows, width), dtype=np.uint32)
+    if out is None:
+        out = np.empty((rows, width), dtype=np.uint8)
+        reuse = True
+    else:
+        reuse = False
+
+    for y in range(0, height, rows):
+        chunk = pixels[y : y + rows]
+        n = len(chunk)
+        acc, tmp = luma[:n], term[:n]
+
+        # dtype makes the products uint32 on every numpy; without it numpy
+        # 1.x picks a uint16 loop from the scalar's value and wraps
+        np.multiply(chunk[..., 2], weight_r, out=acc, dtype=np.uint32)
+        np.multiply(chunk[..., 1], weight_g, out=tmp, dtype=np.uint32)
+        acc += tmp
+        np.multiply(chunk[..., 0], weight_b, out=tmp, dtype=np.uint32)
+        acc += tmp
+        if format == cairo.FORMAT_ARGB32:  # rgb24 is opaque throughout
+            np.take(background_share, chunk[..., 3], out=tmp, mode="clip")
+            acc += tmp
+
+        # round back to 8 bits; invalid premultiplied pixels could overflow
+        acc += 1 << 15
+        acc >>= 16
+        np.minimum(acc, 255, out=acc)
+
+        rows_out = out[:n] if reuse else out[y : y + n]
+        rows_out[...] = acc
+        yield y, rows_out
+
+
+def surface_to_grayscale(surface, background_color=(255, 255, 255)):
     """
-    Returns a string value with the OCR reading
+    Flatten a cairo.ImageSurface onto a background and return its
+    luminosity as a 2D uint8 numpy array.
 
-    :param filepath: The path to the PGM file.
-    :param single_char_reading: The PGM file has only one character
-    :param known_translation: It is known what the string is originally
-    :param render_vertically: The image is written verticallyl
-    :return: string val
+    :param surface: The Cairo ImageSurface to convert.
+    :param background_color: The RGB background color for alpha blending.
     """
-    import subprocess
     import numpy as np
 
-    def pgm_to_cairo_image_surface(pgm_filepath):
+    grayscale = np.empty((surface.get_height(), surface.get_width()), dtype=np.uint8)
+    for _ in _grayscale_chunks(surface, background_color, out=grayscale):
+        pass
+    return grayscale
+
+
+def _pgm_header(width, height):
+    return f"P5\n{width} {height}\n255\n".encode("ascii")
+
+
+def surface_to_pgm(surface, filepath, background_color=(255, 255, 255)):
+    """
+    Saves a cairo.ImageSurface to a binary PGM file, incorporating alpha blending.
+
+    Rows are converted and written a chunk at a time, so no full-size
+    copy of the image is ever held in memory.
+
+    :param surface: The Cairo ImageSurface (or 2D uint8 grayscale array) to save.
+    :param filepath: The output filepath for the PGM file, or a binary
+        file object or file descriptor (such as a pipe) to write it to.
+    :param background_color: The RGB background color for alpha blending.
+    """
+    if isinstance(filepath, int):
+        with open(filepath, "wb", closefd=False) as f:
+            _write_pgm(surface, f, background_color)
+    elif _is_path(filepath):
+        with open(filepath, "wb") as f:
+            _write_pgm(surface, f, background_color)
+    else:
+        _write_pgm(surface, filepath, background_color)
+
+
+def _write_pgm(source, f, background_color):
+    import numpy as np
+
+    if not isinstance(source, cairo.ImageSurface):
+        grayscale = np.ascontiguousarray(source, dtype=np.uint8)
+        f.write(_pgm_header(grayscale.shape[1], grayscale.shape[0]))
+        f.write(grayscale.data)
+        return
+
+    f.write(_pgm_header(source.get_width(), source.get_height()))
+    for _, rows in _grayscale_chunks(source, background_color):
+        f.write(rows.data)
+
+
+def pgm_bytes(source, background_color=(255, 255, 255)):
+    """
+    Encode a surface or grayscale array as binary PGM, entirely in memory.
+
+    Pixels are converted or copied straight into the returned buffer,
+    which is the only full-size allocation made.
+
+    :param source: A cairo.ImageSurface or a 2D uint8 grayscale array.
+    :param background_color: The RGB background color for alpha blending.
+    :return: bytearray of the complete PGM file
+    """
+    import numpy as np
+
+    if isinstance(source, cairo.ImageSurface):
+        width, height = source.get_width(), source.get_height()
+    else:
+        source = np.asarray(source, dtype=np.uint8)
+        height, width = source.shape
+
+    header = _pgm_header(width, height)
+    data = bytearray(len(header) + width * height)
+    data[: len(header)] = header
+    grayscale = np.frombuffer(
+        data, dtype=np.uint8, count=width * height, offset=len(header)
+    ).reshape(height, width)
+
+    if isinstance(source, cairo.ImageSurface):
+        for _ in _grayscale_chunks(source, background_color, out=grayscale):
+            pass
+    else:
+        grayscale[...] = source
+    return data
+
+
+def read_pgm(path, as_surface=False):
+    """
+    Read a binary PGM (P5) or PBM (P4) file by memory-mapping it.
+
+    The header is parsed in place and 8-bit PGM pixels come back as a
+    read-only numpy view of the mapping, so nothing is copied; the
+    mapping stays open for as long as the view is referenced. PBM bits
+    are unpacked to 0 (black) and 255 (white).
+
+    :param path: path to the PGM or PBM file
+    :param as_surface: return a cairo.FORMAT_A8 ImageSurface with the
+        pixels as alpha instead; rows are padded out to cairo's A8
+        stride, and the mapping itself is wrapped when none is needed
+    :return: (height, width) uint8 array, or a cairo.ImageSurface
+    """
+    import mmap
+
+    with open(path, "rb") as f:
+        # a private copy-on-write mapping can back a (writable) surface
+        access = mmap.ACCESS_COPY if as_surface else mmap.ACCESS_READ
+        mapping = mmap.mmap(f.fileno(), 0, access=access)
+
+    pixels = _pnm_pixels(mapping)
+    if not as_surface:
+        return pixels
+    return _a8_surface(pixels)
+
+
+def _pnm_header(data):
+    """
+    Parse the header of binary PGM (P5) or PBM (P4) data.
+
+    :param data: bytes-like holding at least the whole header
+    :return: (magic, width, height, maxval, offset of the raster)
+    """
+    # whitespace separated fields, with comments allowed between them
+    fields = []
+    field_count = 4
+    pos = 0
+    while len(fields) < field_count:
+        if pos >= len(data):
+            raise ValueError("Truncated PGM/PBM header.")
+        if data[pos : pos + 1].isspace():
+            pos += 1
+        elif data[pos : pos + 1] == b"#":
+            end = data.find(b"\n", pos)
+            pos = len(data) if end < 0 else end + 1
+        else:
+            end = pos
+            while end < len(data) and not data[end : end + 1].isspace():
+                end += 1
+            fields.append(bytes(data[pos:end]))
+            pos = end
+
+            if len(fields) == 1:
+                if fields[0] not in (b"P4", b"P5"):
+                    raise ValueError(
+                        "Unsupported format; only binary PGM (P5) and PBM (P4) "
+                        "are supported."
+                    )
+                field_count = 3 if fields[0] == b"P4" else 4  # pbm has no maxval
+
+    maxval = int(fields[3]) if field_count == 4 else 1
+    # a single whitespace byte precedes the raster
+    return fields[0], int(fields[1]), int(fields[2]), maxval, pos + 1
+
+
+def _pnm_pixels(data):
+    """
+    Return the pixels of binary PGM or PBM data as a (height, width)
+    uint8 array; 8-bit PGM pixels are a view of data, not a copy.
+
+    :param data: PGM or PBM file contents, as any bytes-like object
+    """
+    import numpy as np
+
+    magic, width, height, maxval, offset = _pnm_header(data)
+
+    if magic == b"P4":
+        row_bytes = (width + 7) // 8
+        _check_raster(data, offset, row_bytes * height)
+        packed = np.frombuffer(
+            data, dtype=np.uint8, count=row_bytes * height, offset=offset
+        ).reshape(height, row_bytes)
+        # set bits are black
+        return (1 - np.unpackbits(packed, axis=1, count=width)) * np.uint8(255)
+
+    if maxval > 255:
+        raise ValueError("Unsupported maxval; only 8-bit PGM files are supported.")
+    _check_raster(data, offset, width * height)
+    pixels = np.frombuffer(
+        data, dtype=np.uint8, count=width * height, offset=offset
+    ).reshape(height, width)
+    if maxval != 255:
+        pixels = ((pixels.astype(np.uint16) * 255 + maxval // 2) // maxval).astype(
+            np.uint8
+        )
+    return pixels
+
+
+def _check_raster(data, offset, size):
+    if len(data) - offset < size:
+        raise ValueError(
+            f"Read buffer size is too small: {len(data) - offset} < {size}"
+        )
+
+
+def _a8_surface(pixels):
+    """
+    Wrap (height, width) uint8 pixels as a cairo.FORMAT_A8 ImageSurface,
+    copying them only if cairo's stride needs row padding.
+
+    :param pixels: 2D uint8 array
+    """
+    import numpy as np
+
+    height, width = pixels.shape
+    stride = cairo.ImageSurface.format_stride_for_width(cairo.FORMAT_A8, width)
+    if stride == width and pixels.flags.c_contiguous and pixels.flags.writeable:
+        data = pixels
+    else:
+        data = np.zeros((height, stride), dtype=np.uint8)
+        data[:, :width] = pixels
+    return cairo.ImageSurface.create_for_data(
+        data, cairo.FORMAT_A8, width, height, stride
+    )
+
+
+def _is_path(source):
+    return isinstance(source, (str, bytes, os.PathLike))
+
+
+def _pgm_data(source):
+    """
+    Return the PGM file contents for any supported OCR input.
+
+    :param source: A PGM file path, cairo.ImageSurface or grayscale array.
+    """
+    if _is_path(source):
+        with open(source, "rb") as f:
+            return f.read()
+    return pgm_bytes(source)
+
+
+@contextmanager
+def _ocr_input(source, data=None):
+    """
+    Yield a file path nhocr can read for any supported OCR input.
+
+    Paths pass straight through. Surfaces and arrays are encoded in
+    memory and written to a short-lived file under OCR_TEMP_DIR, which
+    is RAM-backed (/dev/shm) where available so no disk I/O is done.
+
+    :param source: A PGM file path, cairo.ImageSurface or grayscale array.
+    :param data: the already encoded PGM bytes of source, if at hand
+    """
+    import tempfile
+
+    if _is_path(source):
+        yield source
+        return
+
+    with tempfile.NamedTemporaryFile(
+        suffix=".pgm", dir=OCR_TEMP_DIR, delete=True
+    ) as tmpfile:
+        tmpfile.write(pgm_bytes(source) if data is None else data)
+        tmpfile.flush()
+        yield tmpfile.name
+
+
+def _recognize(source, mode, timeout=None, data=None, key=None, backend=None):
+    """
+    Return the backend's raw output for one image, served from OCR_CACHE
+    when the same pixels have been read in the same mode before.
+
+    :param source: A PGM file path, cairo.ImageSurface or grayscale array.
+    :param mode: "-line" or "-mchar"
+    :param timeout: seconds before the nhocr process is killed
+    :param data: the already encoded PGM bytes of source, if at hand
+    :param key: cache key of a lookup the caller already missed on
+    :param backend: OcrBackend or its name; defaults to OCR_BACKEND
+    """
+    backend = get_ocr_backend(backend)
+    if key is None:
+        if data is None:
+            data = _pgm_data(source)
+        key = OCR_CACHE.key(data, mode, backend)
+        output = OCR_CACHE.get(key)
+        if output is not None:
+            return output
+
+    output = backend.recognize(source, mode, data=data, timeout=timeout)
+    OCR_CACHE.put(key, output)
+    return output
+
+
+def _run_nhocr(filepath, mode, timeout=None, command=None):
+    """
+    Run nhocr over one image and return its raw output text.
+
+    :param filepath: The path to the PGM file.
+    :param mode: "-line" or "-mchar"
+    :param timeout: seconds before the nhocr process is killed
+    :param command: nhocr executable; defaults to NHOCR_COMMAND
+    """
+    import subprocess
+
+    command = [
+        command or NHOCR_COMMAND,
+        mode,
+        "-o",
+        "-",
+        filepath,
+    ]  # load the file next
+    return subprocess.check_output(
+        command, stderr=subprocess.STDOUT, universal_newlines=True, timeout=timeout
+    )
+
+
+def _run_nhocr_many(filepaths, timeout=None, command=None):
+    """
+    Recognize several single-character images with one nhocr process,
+    so the character dictionary is loaded once for the whole group.
+
+    Returns one -mchar output section per image, or None when nhocr's
+    output can't be attributed to the images one-to-one: the number of
+    "IMG <n>" sections must match the images, and be numbered in order.
+    Callers then read the group one image at a time.
+
+    :param filepaths: paths to PGM files, one character each
+    :param timeout: seconds before the nhocr process is killed
+    :param command: nhocr executable; defaults to NHOCR_COMMAND
+    """
+    import subprocess
+
+    command = [command or NHOCR_COMMAND, "-mchar", "-o", "-"] + list(filepaths)
+    output = subprocess.check_output(
+        command, stderr=subprocess.STDOUT, universal_newlines=True, timeout=timeout
+    )
+
+    # every image's candidate table starts with an "IMG <n>" line
+    sections = []
+    numbers = []
+    for line in output.split("\n"):
+        if line.startswith("IMG"):
+            sections.append([])
+            number = line[3:].strip()
+            numbers.append(int(number) if number.isdigit() else None)
+        elif sections:
+            sections[-1].append(line)
+
+    if len(sections) != len(filepaths):
+        return None
+    # numbered consecutively, whether nhocr counts from 0 or 1
+    if numbers[0] is None or numbers != list(
+        range(numbers[0], numbers[0] + len(numbers))
+    ):
+        return None
+    return ["\n".join(lines) for lines in sections]
+
+
+def _ocr_result(output, single_char_reading):
+    # convert raw nhocr output into an OcrResult
+    if not single_char_reading:
+        return OcrResult(output.strip().replace(" ", ""), None)
+    candidates = parse_nhocr_output(output)
+    if not candidates:
+        return OcrResult(None, output)
+    return OcrResult(candidates[0]["character"], None)
+
+
+class OcrBackend(abc.ABC):
+    """
+    Interface to a recognizer, producing nhocr-format output.
+
+    Whatever does the recognizing, readings are returned as the text
+    nhocr would print: the line for "-line", and a candidate table of
+    "R <rank> <char> 0 0 <score>" rows for "-mchar". Everything built on
+    that output (the cache, parse_nhocr_output, fallbacks) is shared.
+    Failures should be raised as subprocess.CalledProcessError or
+    OSError, which the batch functions capture per image.
+
+    Subclasses implement recognize(); the rest have workable defaults.
+    """
+
+    name = "backend"
+    multi_image = False  # recognize_many() reads a group in one pass
+
+    @property
+    def cache_id(self):
+        # distinguishes this recognizer's readings in OCR_CACHE
+        return self.name
+
+    @abc.abstractmethod
+    def recognize(self, source, mode, data=None, timeout=None):
         """
-        Creates a cairo.ImageSurface from a binary PGM file.
-        Since it is coming from PGM, it's an 8bit A8 (alpha) representation.
+        Return the raw output for one image.
 
-        :param pgm_filepath: The path to the PGM file.
-        :return: A new cairo.ImageSurface containing the image data.
+        :param source: A PGM file path, cairo.ImageSurface or grayscale array.
+        :param mode: "-line" or "-mchar"
+        :param data: the already encoded PGM bytes of source, if at hand
+        :param timeout: seconds the recognition may take
         """
-        with open(pgm_filepath, "rb") as f:
-            header = f.readline().strip()
-            if header != b"P5":
-                raise ValueError(
-                    "Unsupported PGM format; only binary PGM (P5) is supported."
-                )
 
-            dimensions_line = f.readline().strip()
-            while dimensions_line.startswith(b"#"):
-                dimensions_line = f.readline().strip()
-            width, height = map(int, dimensions_line.split())
+    def recognize_many(self, sources, data=None, timeout=None):
+        """
+        Return one -mchar output per image, or None if the group could not
+        be read as a whole.
 
-            maxval_line = f.readline().strip()
-            while maxval_line.startswith(b"#"):
-                maxval_line = f.readline().strip()
-            maxval = int(maxval_line)
+        :param sources: PGM file paths, cairo.ImageSurfaces or grayscale arrays
+        :param data: the already encoded PGM bytes of each source, if at hand
+        :param timeout: seconds the recognition may take
+        """
+        data = data or [None] * len(sources)
+        return [
+            self.recognize(source, "-mchar", d, timeout)
+            for source, d in zip(sources, data)
+        ]
 
-            if maxval > 255:
-                raise ValueError(
-                    "Unsupported maxval; only 8-bit PGM files are supported."
-                )
+    async def recognize_async(self, source, mode, data=None, timeout=None):
+        """
+        Awaitable recognize(); runs it on a worker thread by default.
+        """
+        import asyncio
+
+        return await asyncio.to_thread(self.recognize, source, mode, data, timeout)
+
+
+_NHOCR_MULTI_IMAGE = {}  # nhocr command -> whether it splits output per image
+_NHOCR_MULTI_IMAGE_LOCK = threading.Lock()
 
-            # Correctly calculate the expected buffer size
-            stride = cairo.ImageSurface.format_stride_for_width(cairo.FORMAT_A8, width)
-            expected_size = height * stride
 
-            # Adjust the reading of image data to match the expected size
-            image_data = np.fromfile(
-                f, dtype=np.uint8, count=expected_size
-            )  # Read exactly 'expected_size' bytes
+def _nhocr_reads_many(command):
+    """
+    Return whether an nhocr command reads several images per run with
+    output _run_nhocr_many can split, probing it once with two images.
+
+    :param command: nhocr executable
+    """
+    import subprocess
+    import numpy as np
 
-            if image_data.size < expected_size:
-                raise ValueError(
-                    f"Read buffer size is too small: {image_data.size} < {expected_size}"
+    with _NHOCR_MULTI_IMAGE_LOCK:
+        if command not in _NHOCR_MULTI_IMAGE:
+            probe = np.full((32, 32), 255, dtype=np.uint8)
+            probe[8:24, 8:24] = 0
+            try:
+                outputs = NhocrBackend(command, multi_image=True).recognize_many(
+                    [probe, probe], timeout=10
                 )
+            except (subprocess.SubprocessError, OSError):
+                outputs = None
+            _NHOCR_MULTI_IMAGE[command] = outputs is not None
+        return _NHOCR_MULTI_IMAGE[command]
+
+
+class NhocrBackend(OcrBackend):
+    """
+    Recognize by running the nhocr executable, one process per image or
+    per group of single-character images.
+
+    :param command: nhocr executable; defaults to NHOCR_COMMAND
+    :param multi_image: pass groups of images to one process; if None,
+        only when a probe run shows the command splits its output per
+        image. A group whose output still can't be split is retried one
+        image at a time.
+    """
+
+    name = "nhocr"
+
+    def __init__(self, command=None, multi_image=None):
+        self.command = command
+        self._multi_image = multi_image
+
+    @property
+    def cache_id(self):
+        return self.command or NHOCR_COMMAND
+
+    @property
+    def multi_image(self):
+        if self._multi_image is None:
+            return _nhocr_reads_many(self.cache_id)
+        return self._multi_image
+
+    def recognize(self, source, mode, data=None, timeout=None):
+        with _ocr_input(source, data) as filepath:
+            return _run_nhocr(filepath, mode, timeout, command=self.command)
+
+    def recognize_many(self, sources, data=None, timeout=None):
+        from contextlib import ExitStack
+
+        data = data or [None] * len(sources)
+        with ExitStack() as stack:
+            filepaths = [
+                stack.enter_context(_ocr_input(source, d))
+                for source, d in zip(sources, data)
+            ]
+            return _run_nhocr_many(filepaths, timeout, command=self.command)
+
+    async def recognize_async(self, source, mode, data=None, timeout=None):
+        with _ocr_input(source, data) as filepath:
+            return await _run_nhocr_async(filepath, mode, timeout, command=self.command)
+
+
+class InProcessBackend(OcrBackend):
+    """
+    Recognize by calling a Python function, such as a binding to an OCR
+    library, with the image's PGM bytes; no process or file is involved.
+
+    :param function: called as function(pgm_data, mode), returning
+        nhocr-format output
+    :param name: identifies the recognizer in OCR_CACHE
+    """
 
-            image_data = image_data.reshape(
-                (height, stride)
-            )  # Reshape according to height and stride
-            # Note: The rightmost columns in each row might be padding and should not affect the image content
+    def __init__(self, function, name="in-process"):
+        self.function = function
+        self.name = name
 
-            data_bytes = np.copy(image_data).astype(np.uint8).tobytes()
+    def recognize(self, source, mode, data=None, timeout=None):
+        return self.function(_pgm_data(source) if data is None else data, mode)
 
-            # Create the Cairo surface
-            data_bytearray = bytearray(data_bytes)
-            surface = cairo.ImageSurface.create_for_data(
-                data_bytearray, cairo.FORMAT_A8, width, height, stride
+
+class TemplateBackend(OcrBackend):
+    """
+    Deterministic stand-in recognizer that matches images against glyphs
+    rendered by draw_character.
+
+    Every tile is compared with a template of each known character at the
+    same size, ranked by cosine similarity of their ink. Rendered text is
+    read back exactly and quickly, so rendering and I/O costs can be
+    measured without nhocr installed; it is no judge of handwriting.
+
+    :param characters: characters to recognize; kana by default
+    :param font_path: font the templates are rendered with
+    :param candidates: rows reported per character in -mchar output
+    """
+
+    name = "template"
+
+    def __init__(self, characters=None, font_path=FONT_PATH, candidates=5):
+        if characters is None:
+            characters = [chr(c) for c in range(0x3041, 0x3097)]
+            characters += [chr(c) for c in range(0x30A1, 0x30FB)]
+            characters += ["、", "。"]
+        self.characters = list(characters)
+        self.font_path = font_path
+        self.candidates = candidates
+        self._templates = {}  # (width, height) -> normalized ink rows
+        self._lock = threading.Lock()
+
+    @property
+    def cache_id(self):
+        return f"template\0{self.font_path}\0{''.join(self.characters)}"
+
+    def recognize(self, source, mode, data=None, timeout=None):
+        import numpy as np
+
+        gray = _pnm_pixels(_pgm_data(source) if data is None else data)
+        if mode == "-mchar":
+            scores = self._match(gray)
+            if scores is None:
+                return ""
+            ranked = np.argsort(-scores, kind="stable")[: self.candidates]
+            return "".join(
+                f"R\t{rank}\t{self.characters[i]}\t0\t0\t{scores[i]:.4f}\n"
+                for rank, i in enumerate(ranked, start=1)
             )
 
-        return surface
+        # -line: square tiles along the longer side, blanks skipped
+        height, width = gray.shape
+        text = []
+        for x, y, tile_width, tile_height in tile_rectangles(width, height):
+            scores = self._match(gray[y : y + tile_height, x : x + tile_width])
+            if scores is not None:
+                text.append(self.characters[int(np.argmax(scores))])
+        return "".join(text) + "\n"
+
+    def _match(self, gray):
+        # cosine similarity of a tile's ink with every template, or None
+        # for a tile without ink
+        import numpy as np
+
+        ink = 255 - gray.astype(np.float32).ravel()
+        norm = np.linalg.norm(ink)
+        if norm == 0:
+            return None
+        return self._templates_for(*reversed(gray.shape)) @ (ink / norm)
+
+    def _templates_for(self, width, height):
+        import numpy as np
+
+        with self._lock:
+            templates = self._templates.get((width, height))
+            if templates is None:
+                font_size = max(1, round(FONT_SIZE * min(width, height) / TILE_WIDTH))
+                rows = []
+                for char in self.characters:
+                    tile = draw_character(
+                        char, font_size, self.font_path, FONT_ALPHA, width, height
+                    )
+                    ink = 255 - _pnm_pixels(pgm_bytes(tile)).astype(np.float32)
+                    rows.append(ink.ravel() / max(np.linalg.norm(ink), 1))
+                templates = self._templates[(width, height)] = np.stack(rows)
+        return templates
 
-    def pgm_to_inverted_argb32(filepath):
-        """
-        Load a PGM file which is 8 bit and grayscale
-        This requires converting it to ARGB and fabricating color data
-        because PGM is grayscale and treated more like A8/alpha layer data only
-        Set background to white, use the a8 mask (pgm) to fill in the black
-        :param filepath: The path to the PGM file.
-        :return: A new cairo.ImageSurface containing the image data.
-        """
-        # Load the PGM file into an A8 surface
-        a8_surface = pgm_to_cairo_image_surface(filepath)
-        width, height = a8_surface.get_width(), a8_surface.get_height()
-        a8_data = np.ndarray(
-            shape=(height, width), dtype=np.uint8, buffer=a8_surface.get_data()
+
+_OCR_BACKENDS = {"nhocr": NhocrBackend, "template": TemplateBackend}
+_NAMED_BACKENDS = {}
+_NAMED_BACKENDS_LOCK = threading.Lock()
+
+
+def get_ocr_backend(backend=None):
+    """
+    Resolve a backend argument to an OcrBackend.
+
+    :param backend: an OcrBackend, the name of a built-in one ("nhocr" or
+        "template"), or None for the global OCR_BACKEND
+    """
+    if backend is None:
+        return OCR_BACKEND
+    if not isinstance(backend, str):
+        return backend
+
+    with _NAMED_BACKENDS_LOCK:
+        if backend not in _NAMED_BACKENDS:
+            if backend not in _OCR_BACKENDS:
+                raise ValueError(f"Unknown OCR backend: {backend!r}")
+            _NAMED_BACKENDS[backend] = _OCR_BACKENDS[backend]()
+        return _NAMED_BACKENDS[backend]
+
+
+def set_ocr_backend(backend):
+    """
+    Select the backend every OCR function uses when none is passed, and
+    return the one it replaces.
+
+    :param backend: an OcrBackend or the name of a built-in one
+    """
+    global OCR_BACKEND
+    previous, OCR_BACKEND = OCR_BACKEND, get_ocr_backend(backend)
+    return previous
+
+
+OCR_BACKEND = get_ocr_backend("nhocr")
+
+
+def ocr_batch(
+    sources,
+    single_char_reading=True,
+    max_workers=None,
+    timeout=None,
+    images_per_process=None,
+    callback=None,
+    backend=None,
+    cancel=None,
+):
+    """
+    Recognize many images concurrently on a bounded pool of nhocr processes.
+
+    Failures are captured per image instead of being returned as text:
+    each result is an OcrResult whose error holds the nhocr output (or a
+    description of the timeout) and whose text is None.
+
+    Single-character readings are grouped so each nhocr process handles
+    several images, paying the process start and dictionary load once
+    per group instead of once per tile.
+
+    :param sources: PGM file paths, cairo.ImageSurfaces or grayscale arrays
+    :param single_char_reading: read each image as one character (-mchar)
+    :param max_workers: concurrent nhocr processes; defaults to OCR_WORKERS
+    :param timeout: seconds allowed for each nhocr invocation
+    :param images_per_process: largest group handed to one nhocr process;
+        defaults to OCR_IMAGES_PER_PROCESS
+    :param callback: called as callback(index, result) as soon as each
+        image is recognized, from the worker thread that recognized it
+    :param backend: OcrBackend or its name; defaults to OCR_BACKEND
+    :param cancel: a threading.Event; once set, images not yet handed to
+        nhocr are skipped, their results carrying the error "cancelled"
+    :return: list of OcrResult, in the same order as sources
+    """
+    import subprocess
+    from concurrent.futures import ThreadPoolExecutor
+
+    mode = "-mchar" if single_char_reading else "-line"
+    backend = get_ocr_backend(backend)
+
+    def recognize(source, data=None, key=None):
+        try:
+            output = _recognize(source, mode, timeout, data, key, backend)
+        except subprocess.CalledProcessError as e:
+            return OcrResult(None, e.output)
+        except subprocess.TimeoutExpired:
+            return OcrResult(None, f"nhocr timed out after {timeout}s")
+        except OSError as e:
+            return OcrResult(None, str(e))
+        return _ocr_result(output, single_char_reading)
+
+    def recognize_group(group):
+        if len(group) == 1 or not backend.multi_image:
+            return [None if cancelled() else recognize(source) for source in group]
+
+        # answer what we can from the cache; only the misses go to nhocr
+        results = [None] * len(group)
+        pending = []
+        for i, source in enumerate(group):
+            data = _pgm_data(source)
+            key = OCR_CACHE.key(data, mode, backend)
+            output = OCR_CACHE.get(key)
+            if output is None:
+                pending.append((i, source, data, key))
+            else:
+                results[i] = _ocr_result(output, single_char_reading)
+
+        if len(pending) > 1:
+            try:
+                outputs = backend.recognize_many(
+                    [source for _, source, _, _ in pending],
+                    [data for _, _, data, _ in pending],
+                    timeout=timeout,
+                )
+                if outputs is not None:
+                    for (i, _, _, key), output in zip(pending, outputs):
+                        OCR_CACHE.put(key, output)
+                        results[i] = _ocr_result(output, True)
+                    pending = []
+            except (subprocess.SubprocessError, OSError):
+                pass  # retry one image at a time to pin the error to its tile
+
+        for i, source, data, key in pending:
+            if cancelled():
+                break
+            results[i] = recognize(source, data, key)
+        return results
+
+    def cancelled():
+        return cancel is not None and cancel.is_set()
+
+    def recognize_indexed(start, group):
+        if cancelled():
+            return [OcrResult(None, "cancelled")] * len(group)
+        results = recognize_group(group)
+        for offset, result in enumerate(results):
+            if result is None:  # cancelled part way through the group
+                results[offset] = OcrResult(None, "cancelled")
+            elif callback:
+                callback(start + offset, result)
+        return results
+
+    sources = list(sources)
+    if len(sources) <= 1:
+        return [recognize_indexed(i, [s])[0] for i, s in enumerate(sources)]
+
+    workers = min(max_workers or OCR_WORKERS, len(sources))
+    group_size = 1
+    if single_char_reading:
+        # big enough groups to amortize nhocr start-up, small enough to keep
+        # every worker busy
+        group_size = max(
+            1,
+            min(
+                images_per_process or OCR_IMAGES_PER_PROCESS,
+                -(-len(sources) // workers),
+            ),
         )
+    starts = range(0, len(sources), group_size)
+    groups = [sources[i : i + group_size] for i in starts]
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # map preserves input order regardless of completion order
+        return [
+            result
+            for results in pool.map(recognize_indexed, starts, groups)
+            for result in results
+        ]
 
-        # Prepare a new ARGB32 surface
-        argb32_surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, width, height)
-        ctx = cairo.Context(argb32_surface)
 
-        # Inversion: Set the background to black and use white for the text
-        # Fill the background
-        ctx.set_source_rgba(0, 0, 0, 1)  # Black background
-        ctx.paint()
+def _pgm_to_inverted_argb32(filepath):
+    """
+    Load a PGM file which is 8 bit and grayscale
+    This requires converting it to ARGB and fabricating color data
+    because PGM is grayscale and treated more like A8/alpha layer data only
+    Set background to white, use the a8 mask (pgm) to fill in the black
+    :param filepath: The path to the PGM file.
+    :return: A new cairo.ImageSurface containing the image data.
+    """
+    return a8_to_inverted_argb32(read_pgm(filepath))
+
+
+def _fallback_tiles(source, tile_count, render_vertically):
+    """
+    Split an OCR input into per-character ARGB32 tiles for single
+    character readings, without re-reading the file when in memory.
 
-        # Set text color
-        for y in range(height):
-            for x in range(width):
-                alpha = a8_data[y, x] / 255.0  # Normalize alpha
-                if alpha > 0:  # Apply white text based on the alpha
-                    ctx.set_source_rgba(1, 1, 1, alpha)  # White with original alpha
-                    ctx.rectangle(x, y, 1, 1)
-                    ctx.fill()
+    :param source: A PGM file path, cairo.ImageSurface or grayscale array.
+    :param tile_count: number of characters in the line
+    :param render_vertically: The image is written vertically
+    """
+    import numpy as np
+
+    if isinstance(source, cairo.ImageSurface):
+        inverted = a8_to_inverted_argb32(surface_to_grayscale(source))
+    elif isinstance(source, np.ndarray):
+        inverted = a8_to_inverted_argb32(source)
+    else:
+        inverted = _pgm_to_inverted_argb32(source)
+
+    return [
+        tile_view(inverted, x, y, tile_width, tile_height)
+        for x, y, tile_width, tile_height in tile_rectangles(
+            inverted.get_width(),
+            inverted.get_height(),
+            tile_count,
+            render_vertically,
+        )
+    ]
+
+
+def _join_fallback_readings(results, known_translation, render_vertically):
+    """
+    Assemble per-tile OcrResults back into a line reading.
+
+    :param results: list of OcrResult, one per character tile
+    :param known_translation: It is known what the string is originally
+    :param render_vertically: The image is written vertically
+    """
+    retval_chars = []
+
+    if render_vertically:  # VERTICAL TILE BREAKDOWN
+        for result in results:
+            retval_chars.append(result.text or " ")
+    else:  # DEFAULT HORIZONTAL TILE BREAKDOWN
+        for result in results:
+            retval = result.text
+
+            # if we know what it is supposed to look like, we need
+            # to make sure that type 1 false positives are avoided.
+            # characters not in the known_translation sometimes
+            # occur as the OCR'ed result of a provided space
+            if not retval or retval not in known_translation:
+                retval_chars.append(" ")
+            else:
+                retval_chars.append(retval)
+
+    return "".join(retval_chars)
+
+
+def ocr(
+    source,
+    single_char_reading=False,
+    known_translation=None,
+    render_vertically=False,
+    backend=None,
+):
+    """
+    Returns a string value with the OCR reading
 
-        return argb32_surface
+    :param source: The path to a PGM file, a cairo.ImageSurface or a 2D
+        uint8 grayscale array; in-memory inputs never touch the disk.
+    :param single_char_reading: The PGM file has only one character
+    :param known_translation: It is known what the string is originally
+    :param render_vertically: The image is written verticallyl
+    :param backend: OcrBackend or its name; defaults to OCR_BACKEND
+    :return: string val
+    """
+    import subprocess
 
     if single_char_reading:  # when requesting candidate lists
-        command = ["nhocr", "-mchar", "-o", "-", filepath]  # load the file next
         try:
-            output = subprocess.check_output(
-                command, stderr=subprocess.STDOUT, universal_newlines=True
-            )
-            candidates = parse_nhocr_output(output)
-            return candidates[0]["character"]
+            output = _recognize(source, "-mchar", backend=backend)
+            # a tile without ink has no candidates and reads as a space
+            return _ocr_result(output, True).text or " "
         except subprocess.CalledProcessError as e:
             print(f"Error executing nhocr: {e.output}")
             return e.output
     else:  # default expected behavior, -line behavior, even if a single character
-        import tempfile
-
-        command = ["nhocr", "-line", "-o", "-", filepath]  # load the file next
         try:
-            output = subprocess.check_output(
-                command, stderr=subprocess.STDOUT, universal_newlines=True
-            )
+            output = _recognize(source, "-line", backend=backend)
             cleaned = output.strip().replace(" ", "")
             if known_translation and cleaned != known_translation:
                 # known expected value, but didn't get that from ocr
-                # let's split up the filepath pgm by tilesize and run each
+                # let's split up the image by tilesize and run each
                 # character as a single_char_reading
-
-                inverted = pgm_to_inverted_argb32(filepath)
-                retval_chars = []
-
-                if render_vertically:  # VERTICAL TILE BREAKDOWN
-                    adjusted_tile_width = inverted.get_width()
-                    adjusted_tile_height = int(
-                        inverted.get_height() / len(known_translation)
-                    )
-
-                    for i, char in enumerate(known_translation):
-                        extracted = extract_rectangle(
-                            inverted,
-                            0,
-                            i * adjusted_tile_height,
-                            adjusted_tile_width,
-                            adjusted_tile_height,
-                        )
-                        with tempfile.NamedTemporaryFile(
-                            suffix=".pgm", delete=True
-                        ) as tmpfile:
-                            surface_to_pgm(extracted, tmpfile.name)
-                            retval = ocr(tmpfile.name, single_char_reading=True)
-                            retval_chars.append(retval)
-                else:  # DEFAULT HORIZONTAL TILE BREAKDOWN
-                    adjusted_tile_width = int(
-                        inverted.get_width() / len(known_translation)
-                    )
-                    adjusted_tile_height = inverted.get_height()
-
-                    for i, char in enumerate(known_translation):
-                        extracted = extract_rectangle(
-                            inverted,
-                            i * adjusted_tile_width,
-                            0,
-                            adjusted_tile_width,
-                            adjusted_tile_height,
-                        )
-                        with tempfile.NamedTemporaryFile(
-                            suffix=".pgm", delete=True
-                        ) as tmpfile:
-                            surface_to_pgm(extracted, tmpfile.name)
-                            retval = ocr(tmpfile.name, single_char_reading=True)
-
-                            # if we know what it is supposed to look like, we need
-                            # to make sure that type 1 false positives are avoided.
-                            # characters not in the known_translation sometimes
-                            # occur as the OCR'ed result of a provided space
-                            if known_translation and retval not in known_translation:
-                                retval_chars.append(" ")
-                            else:
-                                retval_chars.append(retval)
-
-                return "".join(retval_chars)
+                extracted = _fallback_tiles(
+                    source, len(known_translation), render_vertically
+                )
+                return _join_fallback_readings(
+                    ocr_batch(extracted, backend=backend),
+                    known_translation,
+                    render_vertically,
+                )
             else:
                 return cleaned
         except subprocess.CalledProcessError as e:
@@ -544,62 +2030,245 @@ def ocr(
             return e.output
 
 
-def ocr_by_index(surface, index):
+def ocr_by_index(surface, index, backend=None):
     """
     Returns a string value with the OCR reading of a single character
 
     This function assumes a completely square tile, even if there are
     multiple tiles, horizontally or vertically
 
+    The tile is a view aliasing the surface's pixels, not a copy, so
+    drawing on the surface before this returns changes the reading.
+
     :param filepath: The path to the PGM file.
     :param single_char_reading: The PGM file has only one character
     :param known_translation: It is known what the string is originally
     :param render_vertically: The image is written verticallyl
+    :param backend: OcrBackend or its name; defaults to OCR_BACKEND
     :return: string val
     """
-    import tempfile
+    # this logic assumes completely square tiles
+    x, y, tile_width, tile_height = tile_rectangles(
+        surface.get_width(), surface.get_height()
+    )[index]
+    extracted = tile_view(surface, x, y, tile_width, tile_height)
+
+    return ocr(extracted, single_char_reading=True, backend=backend)
+
+
+def ocr_tiles(
+    surface,
+    tile_count=None,
+    render_vertically=None,
+    indices=None,
+    skip_blank=True,
+    **kwargs,
+):
+    """
+    Recognize every tile of a line surface as one batch.
+
+    The surface is sliced once and the tiles handed to ocr_batch, so a
+    whole line costs a single pass instead of one ocr_by_index call per
+    character. The tiles are views that alias the surface's pixels
+    rather than copies, so drawing on the surface before this returns
+    changes what is recognized.
+
+    :param surface: A cairo.ImageSurface holding a line of tiles.
+    :param tile_count: number of tiles; square tiles are assumed if omitted
+    :param render_vertically: tiles run top to bottom; inferred if omitted
+    :param indices: recognize only these tiles; the rest are left as None
+    :param skip_blank: tiles without ink read as a space, without OCR
+    :param kwargs: passed through to ocr_batch
+    :return: list of OcrResult, one per tile
+    """
+    rectangles = tile_rectangles(
+        surface.get_width(), surface.get_height(), tile_count, render_vertically
+    )
+    if indices is None:
+        indices = range(len(rectangles))
+    indices = list(indices)
+
+    results = [None] * len(rectangles)
+    callback = kwargs.pop("callback", None)
+
+    if skip_blank:
+        # one pass over the line finds the tiles with nothing written
+        metrics = tile_metrics(surface, len(rectangles), render_vertically)
+        for i in indices:
+            if metrics[i].bbox is None:
+                results[i] = OcrResult(" ", None)
+                if callback is not None:
+                    callback(i, results[i])
+        indices = [i for i in indices if results[i] is None]
+
+    # views into the line; its pixels are never duplicated
+    tiles = [tile_view(surface, *rectangles[i]) for i in indices]
+
+    # callbacks report positions in the whole line, not in the batch
+    if callback is not None:
+        kwargs["callback"] = lambda n, result: callback(indices[n], result)
+
+    for i, result in zip(indices, ocr_batch(tiles, single_char_reading=True, **kwargs)):
+        results[i] = result
+    return results
+
+
+async def _run_nhocr_async(filepath, mode, timeout=None, command=None):
+    """
+    Run nhocr over one image without blocking the event loop.
+
+    The nhocr process is killed if the awaiting task is cancelled or the
+    timeout expires, so abandoned recognitions don't keep running.
+
+    :param filepath: The path to the PGM file.
+    :param mode: "-line" or "-mchar"
+    :param timeout: seconds before the nhocr process is killed
+    :param command: nhocr executable; defaults to NHOCR_COMMAND
+    """
+    import asyncio
     import subprocess
 
-    width = surface.get_width()
-    height = surface.get_height()
+    command = [
+        command or NHOCR_COMMAND,
+        mode,
+        "-o",
+        "-",
+        filepath,
+    ]  # load the file next
+    process = await asyncio.create_subprocess_exec(
+        *command, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT
+    )
+    try:
+        stdout, _ = await asyncio.wait_for(process.communicate(), timeout)
+    except BaseException:
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+        raise
 
-    expected_tile_width = TILE_WIDTH
-    expected_tile_height = TILE_HEIGHT
+    output = stdout.decode()
+    if process.returncode:
+        raise subprocess.CalledProcessError(process.returncode, command, output)
+    return output
 
-    expected_tile_count = 1
 
-    # this logic assumes completely square tiles
-    extracted = None
-    if height > width:  # vertical writing
-        expected_tile_width = width
-        expected_tile_count = int(height / width)
-        expected_tile_height = int(height / expected_tile_count)
-
-        extracted = extract_rectangle(
-            surface,
-            0,
-            index * expected_tile_height,
-            expected_tile_width,
-            expected_tile_height,
-        )
-    else:  # horizontal
-        expected_tile_height = height
-        expected_tile_count = int(width / height)
-        expected_tile_width = int(width / expected_tile_count)
-
-        extracted = extract_rectangle(
-            surface,
-            index * expected_tile_width,
-            0,
-            expected_tile_width,
-            expected_tile_height,
+async def _recognize_async(source, mode, timeout=None, backend=None):
+    """
+    Awaitable counterpart of _recognize(), sharing OCR_CACHE with it.
+
+    :param source: A PGM file path, cairo.ImageSurface or grayscale array.
+    :param mode: "-line" or "-mchar"
+    :param timeout: seconds before the nhocr process is killed
+    :param backend: OcrBackend or its name; defaults to OCR_BACKEND
+    """
+    backend = get_ocr_backend(backend)
+    data = _pgm_data(source)
+    key = OCR_CACHE.key(data, mode, backend)
+    output = OCR_CACHE.get(key)
+    if output is None:
+        output = await backend.recognize_async(source, mode, data=data, timeout=timeout)
+        OCR_CACHE.put(key, output)
+    return output
+
+
+async def ocr_async(
+    source,
+    single_char_reading=False,
+    known_translation=None,
+    render_vertically=False,
+    concurrency=None,
+    backend=None,
+):
+    """
+    Awaitable counterpart of ocr(), returning the same string values.
+
+    :param source: The path to a PGM file, a cairo.ImageSurface or a 2D
+        uint8 grayscale array.
+    :param single_char_reading: The PGM file has only one character
+    :param known_translation: It is known what the string is originally
+    :param render_vertically: The image is written vertically
+    :param concurrency: nhocr processes allowed for the per-character
+        fallback; defaults to OCR_WORKERS
+    :param backend: OcrBackend or its name; defaults to OCR_BACKEND
+    :return: string val
+    """
+    import subprocess
+
+    mode = "-mchar" if single_char_reading else "-line"
+    try:
+        output = await _recognize_async(source, mode, backend=backend)
+    except subprocess.CalledProcessError as e:
+        print(f"Error executing nhocr: {e.output}")
+        return e.output
+
+    if single_char_reading:  # when requesting candidate lists
+        return _ocr_result(output, True).text or " "
+
+    cleaned = output.strip().replace(" ", "")
+    if known_translation and cleaned != known_translation:
+        # same per-character fallback as ocr()
+        extracted = _fallback_tiles(source, len(known_translation), render_vertically)
+        results = await ocr_batch_async(
+            extracted, concurrency=concurrency, backend=backend
         )
+        return _join_fallback_readings(results, known_translation, render_vertically)
+    return cleaned
 
-    with tempfile.NamedTemporaryFile(suffix=".pgm", delete=True) as tmpfile:
-        surface_to_pgm(extracted, tmpfile.name)
-        retval = ocr(tmpfile.name, single_char_reading=True)
 
-        return retval
+async def ocr_by_index_async(surface, index, backend=None):
+    """
+    Awaitable counterpart of ocr_by_index(); the tile aliases the
+    surface in the same way.
+
+    :param surface: A cairo.ImageSurface holding a line of square tiles.
+    :param index: position of the tile to read
+    :param backend: OcrBackend or its name; defaults to OCR_BACKEND
+    :return: string val
+    """
+    x, y, tile_width, tile_height = tile_rectangles(
+        surface.get_width(), surface.get_height()
+    )[index]
+    extracted = tile_view(surface, x, y, tile_width, tile_height)
+    return await ocr_async(extracted, single_char_reading=True, backend=backend)
+
+
+async def ocr_batch_async(
+    sources, single_char_reading=True, concurrency=None, timeout=None, backend=None
+):
+    """
+    Awaitable counterpart of ocr_batch().
+
+    At most concurrency nhocr processes run at once; cancelling the
+    awaiting task kills every process still running.
+
+    :param sources: PGM file paths, cairo.ImageSurfaces or grayscale arrays
+    :param single_char_reading: read each image as one character (-mchar)
+    :param concurrency: concurrent nhocr processes; defaults to OCR_WORKERS
+    :param timeout: seconds allowed for each nhocr invocation
+    :param backend: OcrBackend or its name; defaults to OCR_BACKEND
+    :return: list of OcrResult, in the same order as sources
+    """
+    import asyncio
+    import subprocess
+
+    mode = "-mchar" if single_char_reading else "-line"
+    semaphore = asyncio.Semaphore(concurrency or OCR_WORKERS)
+
+    async def recognize(source):
+        async with semaphore:
+            try:
+                output = await _recognize_async(
+                    source, mode, timeout=timeout, backend=backend
+                )
+            except subprocess.CalledProcessError as e:
+                return OcrResult(None, e.output)
+            except asyncio.TimeoutError:
+                return OcrResult(None, f"nhocr timed out after {timeout}s")
+            except OSError as e:
+                return OcrResult(None, str(e))
+        return _ocr_result(output, single_char_reading)
+
+    return list(await asyncio.gather(*(recognize(source) for source in sources)))
 
 
 def parse_nhocr_output(output):
@@ -626,35 +2295,108 @@ def parse_nhocr_output(output):
     return characters
 
 
-def find_tight_bounding_box(image_path):
+def _grayscale_source(source):
+    """
+    Return any supported image as a 2D uint8 grayscale array.
+
+    :param source: an image path, a cairo.ImageSurface or a 2D uint8 array
+    """
+    import numpy as np
+
+    if isinstance(source, cairo.ImageSurface):
+        return surface_to_grayscale(source)
+    if not _is_path(source):
+        return np.asarray(source, dtype=np.uint8)
+
+    try:
+        return read_pgm(source)
+    except ValueError:  # not pgm or pbm; let PIL decode it
+        from PIL import Image
+
+        with Image.open(source) as img:
+            return np.array(img.convert("L"))
+
+
+def find_tight_bounding_box(source):
     """
     Finds the x and y dimensions where the first non-white pixel exists going
     from each direction inward.
 
+    :param source: an image path, a cairo.ImageSurface or a 2D uint8 array
     :param output: (leftmost x, topmost y, rightmost x, bottommost y)
     """
     import numpy as np
-    from PIL import Image
 
-    with Image.open(image_path) as img:
-        # Convert the image to grayscale and then to a NumPy array
-        img_array = np.array(img.convert("L"))
+    # rows and columns holding any non-white (255) pixel
+    ink = _grayscale_source(source) != 255
+    rows = np.flatnonzero(ink.any(axis=1))
+    cols = np.flatnonzero(ink.any(axis=0))
+
+    # Check if any content was found
+    if rows.size == 0:
+        return None  # No content found
 
-        # Find all non-white (assuming white is 255) pixel positions
-        non_white_pixels = np.where(img_array != 255)
+    return (cols[0], rows[0], cols[-1], rows[-1])
 
-        # Extract rows and columns of non-white pixels
-        rows, cols = non_white_pixels
 
-        # Check if any content was found
-        if rows.size == 0 or cols.size == 0:
-            return None  # No content found
+def tile_metrics(source, tile_count=None, render_vertically=None, threshold=59):
+    """
+    Measure every tile of a line at once: the tight bounding box of its
+    ink, the proportion of the tile that box covers, and its size class.
+
+    Each tile is reduced to per-row and per-column "any ink" flags in a
+    single vectorized pass, so a whole line costs about one look at its
+    pixels. Results agree with find_tight_bounding_box,
+    find_rectangle_proportion and guess_character_size run on each
+    extracted tile.
+
+    :param source: a line as an image path, cairo.ImageSurface or 2D uint8 array
+    :param tile_count: number of tiles; square tiles are assumed if omitted
+    :param render_vertically: tiles run top to bottom; inferred if omitted
+    :param threshold: largest top row of a "large" character, as for
+        guess_character_size; 59 suits the 200px tiles draw.py uses
+    :return: list of TileMetrics, one per tile; tiles without ink have
+        bbox and size None and proportion 0.0
+    """
+    import numpy as np
 
-        # Determine the bounding box edges
-        top, bottom = np.min(rows), np.max(rows)
-        left, right = np.min(cols), np.max(cols)
+    ink = _grayscale_source(source) != 255
+    height, width = ink.shape
+    rectangles = tile_rectangles(width, height, tile_count, render_vertically)
+    _, _, tile_width, tile_height = rectangles[0]
+    count = len(rectangles)
 
-        return (left, top, right, bottom)
+    # (tile, row) and (tile, column) flags; rectangles are equal and abut
+    if rectangles[-1][1] > 0:  # vertical
+        tiles = ink[: count * tile_height, :tile_width].reshape(
+            count, tile_height, tile_width
+        )
+        rows_inked, cols_inked = tiles.any(axis=2), tiles.any(axis=1)
+    else:
+        tiles = ink[:tile_height, : count * tile_width].reshape(
+            tile_height, count, tile_width
+        )
+        rows_inked, cols_inked = tiles.any(axis=2).T, tiles.any(axis=0)
+
+    inked = rows_inked.any(axis=1)
+    top = rows_inked.argmax(axis=1)
+    bottom = tile_height - 1 - rows_inked[:, ::-1].argmax(axis=1)
+    left = cols_inked.argmax(axis=1)
+    right = tile_width - 1 - cols_inked[:, ::-1].argmax(axis=1)
+    proportion = (right - left) * (bottom - top) / (tile_width * tile_height)
+
+    return [
+        (
+            TileMetrics(
+                (int(left[i]), int(top[i]), int(right[i]), int(bottom[i])),
+                float(proportion[i]),
+                "large" if top[i] <= threshold else "small",
+            )
+            if inked[i]
+            else TileMetrics(None, 0.0, None)
+        )
+        for i in range(count)
+    ]
 
 
 def find_rectangle_proportion(
@@ -715,3 +2457,176 @@ def paint_grayscale_to_green(source_surface):
     ctx.mask_surface(source_surface, 0, 0)  # Mask by the original's alpha
 
     return new_surface
+
+
+def simplify_polyline(points, epsilon=STROKE_EPSILON):
+    """
+    Simplify a polyline with the Ramer-Douglas-Peucker algorithm.
+
+    :param points: (n, 2) array of x-y coordinates
+    :param epsilon: largest distance a dropped point may lie from the result
+    :return: boolean mask over points of those that are kept
+    """
+    import numpy as np
+
+    points = np.asarray(points, dtype=np.float64)
+    keep = np.zeros(len(points), dtype=bool)
+    if len(points) == 0:
+        return keep
+    keep[0] = keep[-1] = True
+
+    spans = [(0, len(points) - 1)]
+    while spans:
+        start, end = spans.pop()
+        if end - start < 2:
+            continue
+
+        # distance of every interior point from the start-end chord
+        chord = points[end] - points[start]
+        offsets = points[start + 1 : end] - points[start]
+        length = np.hypot(chord[0], chord[1])
+        if length == 0:
+            distances = np.hypot(offsets[:, 0], offsets[:, 1])
+        else:
+            cross = chord[0] * offsets[:, 1] - chord[1] * offsets[:, 0]
+            distances = np.abs(cross) / length
+
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > epsilon:
+            split = start + 1 + farthest
+            keep[split] = True
+            spans.append((start, split))
+            spans.append((split, end))
+
+    return keep
+
+
+class StrokeStore:
+    """
+    Pen strokes packed into one contiguous float32 array of (x, y)
+    points, with per-stroke offsets into it.
+
+    Points closer than min_distance to the previously kept point are
+    dropped as they arrive, and each stroke is simplified with
+    simplify_polyline when it ends. Iterating the store yields each
+    finished stroke as an (n, 2) array view.
+
+    :param min_distance: px the pen must travel before a point is kept
+    :param epsilon: simplification tolerance for finished strokes, in px
+    :param capacity: points to allocate room for up front
+    """
+
+    def __init__(
+        self, min_distance=STROKE_MIN_DISTANCE, epsilon=STROKE_EPSILON, capacity=1024
+    ):
+        import numpy as np
+
+        self.min_distance = min_distance
+        self.epsilon = epsilon
+        self._points = np.empty((capacity, 2), dtype=np.float32)
+        self._count = 0  # points in use, including the stroke in progress
+        self._offsets = [0]  # stroke i spans _offsets[i]:_offsets[i + 1]
+        self._last_raw = None  # last point seen in the stroke in progress
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("stroke index out of range")
+        start, end = self._offsets[index], self._offsets[index + 1]
+        return self._points[start:end]
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    @property
+    def in_stroke(self):
+        return self._last_raw is not None
+
+    @property
+    def point_count(self):
+        return self._count
+
+    @property
+    def nbytes(self):
+        return self._points.nbytes
+
+    def current_stroke(self):
+        """
+        Return the kept points of the stroke in progress as an (n, 2) view.
+        """
+        return self._points[self._offsets[-1] : self._count]
+
+    def begin_stroke(self, x, y):
+        """
+        Start a new stroke at (x, y), abandoning any unfinished one.
+
+        :param x: x-coordinate
+        :param y: y-coordinate
+        """
+        self._count = self._offsets[-1]
+        self._append(x, y)
+        self._last_raw = (x, y)
+
+    def add_point(self, x, y):
+        """
+        Extend the stroke in progress, returning True if the point was kept.
+
+        :param x: x-coordinate
+        :param y: y-coordinate
+        """
+        if not self.in_stroke:
+            return False
+
+        self._last_raw = (x, y)
+        last_x, last_y = self._points[self._count - 1]
+        if (x - last_x) ** 2 + (y - last_y) ** 2 < self.min_distance**2:
+            return False
+        self._append(x, y)
+        return True
+
+    def end_stroke(self):
+        """
+        Finish the stroke in progress and return it as an (n, 2) view,
+        or None if no stroke was in progress.
+        """
+        if not self.in_stroke:
+            return None
+
+        # the pen's final position always ends the stroke
+        x, y = self._last_raw
+        last_x, last_y = self._points[self._count - 1]
+        if (x, y) != (last_x, last_y):
+            self._append(x, y)
+        self._last_raw = None
+
+        start = self._offsets[-1]
+        stroke = self._points[start : self._count]
+        kept = stroke[simplify_polyline(stroke, self.epsilon)]
+        self._points[start : start + len(kept)] = kept
+        self._count = start + len(kept)
+
+        self._offsets.append(self._count)
+        return self[len(self) - 1]
+
+    def clear(self):
+        """
+        Drop every stroke, keeping the allocated buffer.
+        """
+        self._count = 0
+        self._offsets = [0]
+        self._last_raw = None
+
+    def _append(self, x, y):
+        import numpy as np
+
+        if self._count == len(self._points):
+            grown = np.empty((len(self._points) * 2, 2), dtype=np.float32)
+            grown[: self._count] = self._points[: self._count]
+            self._points = grown
+        self._points[self._count] = (x, y)
+        self._count += 1
@@ -2,15 +2,21 @@
 
 import char_surface as cs
 import cairo
+import trace_cs
 import gi
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
 
 gi.require_version("Gtk", "3.0")
-from gi.repository import Gtk, Gdk
+from gi.repository import Gtk, Gdk, GLib
 
 APP_TITLE = "しゅじsketch"
 
 
 class DrawingArea(Gtk.DrawingArea):
+    INK_WIDTH = 4  # stroke width of the student's writing
+
     def __init__(
         self,
         initial_text=APP_TITLE,
@@ -29,8 +35,19 @@ class DrawingArea(Gtk.DrawingArea):
         self.backing_store = None
         self.surface = None
 
-        self.paths = []  # Add this to store paths
-        self.current_path = []  # Temporary storage for the current drawing path
+        # finished strokes and the one being drawn, packed as float32
+        # points and thinned as they arrive
+        self.paths = cs.StrokeStore()
+        # finished paths, rasterized once as they are committed
+        self.ink = None
+        self.stroke_bounds = None  # area covered by the current path so far
+
+        # per-tile revision, changed whenever a stroke lands on the tile,
+        # and whether the tile has any ink at all; revisions come from one
+        # counter so a tile never returns to an earlier revision
+        self.text = initial_text
+        self.revision = 0
+        self.reset_tiles()
 
         # Connect event handlers for mouse events
         self.add_events(
@@ -42,15 +59,24 @@ class DrawingArea(Gtk.DrawingArea):
         self.connect("motion-notify-event", self.on_motion_notify)
         self.connect("button-release-event", self.on_button_release)
 
-    def change_text(self, text):
-        self.backing_store = None
+    def change_text(self, text, guide_surface=None):
+        # guide_surface, when given, is the already rendered guide text
+        # for text and becomes the backing store as is
+        self.backing_store = guide_surface
         self.text = text
+        self.reset_tiles()
+        self.retouch_tiles()
         if self.RENDER_VERTICALLY:
             self.set_size_request(self.TILESIZE, len(self.text) * self.TILESIZE)
         else:
             self.set_size_request(len(self.text) * self.TILESIZE, self.TILESIZE)
 
     def on_draw(self, widget, cr):
+        # gtk hands us a context already clipped to the invalidated
+        # rectangles, so every paint below only touches damaged pixels;
+        # the live stroke is only replayed when it reaches the damage
+        x0, y0, x1, y1 = cr.clip_extents()
+
         if not self.backing_store:
             # Set the source to the desired color (RGBA)
             cr.set_source_rgba(1, 1, 1, 1)  # For white: (1, 1, 1, 1)
@@ -66,29 +92,113 @@ class DrawingArea(Gtk.DrawingArea):
             cr.set_source_surface(self.surface, 0, 0)
             cr.paint()
 
-        self.draw_paths(cr)  # Draw the user paths
+        # finished strokes come from the ink layer; only the stroke
+        # still being written is drawn point by point
+        cr.set_source_surface(self.ensure_ink(), 0, 0)
+        cr.paint()
+
+        if self.stroke_bounds:
+            sx0, sy0, sx1, sy1 = self.stroke_bounds
+            if sx0 < x1 and sx1 > x0 and sy0 < y1 and sy1 > y0:
+                self.draw_path(cr, self.paths.current_stroke())
 
     def on_button_press(self, widget, event):
         # Start a new path
         if event.button == 1:  # stylus touchdown
-            self.current_path = [(event.x, event.y)]
+            self.paths.begin_stroke(event.x, event.y)
+            self.stroke_bounds = self.damage_point(event.x, event.y)
 
     def on_motion_notify(self, widget, event):
-        # Add point to current path if drawing
-        if self.current_path:
-            self.current_path.append((event.x, event.y))
+        # Add point to current path if drawing, and repaint just the
+        # area around the newly added segment; points dropped by the
+        # store's decimation leave nothing new to paint
+        if self.paths.in_stroke:
+            last_x, last_y = self.paths.current_stroke()[-1]
+            if not self.paths.add_point(event.x, event.y):
+                return
+
+            segment = self.union_bounds(
+                self.damage_point(last_x, last_y),
+                self.damage_point(event.x, event.y),
+            )
+            self.stroke_bounds = self.union_bounds(self.stroke_bounds, segment)
+            self.queue_draw_bounds(segment)
 
     def on_button_release(self, widget, event):
         # Finish the current path
         if event.button == 1:  # stylus liftoff
-            if self.current_path:
-                self.paths.append(self.current_path)
-                self.current_path = []
-                self.queue_draw()
+            stroke = self.paths.end_stroke()
+            if stroke is not None:
+                self.draw_path(cairo.Context(self.ensure_ink()), stroke)
+                # the pen's final position is kept even if decimated
+                self.stroke_bounds = self.union_bounds(
+                    self.stroke_bounds, self.damage_point(*stroke[-1])
+                )
+                self.queue_draw_bounds(self.stroke_bounds)
+                self.touch_tiles(self.stroke_bounds)
+                self.stroke_bounds = None
+
+    def reset_tiles(self):
+        # every tile gets a fresh revision and starts out without ink
+        self.tile_revisions = []
+        for _ in self.text:
+            self.revision += 1
+            self.tile_revisions.append(self.revision)
+        self.tile_inked = [False] * len(self.text)
+
+    def tiles_in_bounds(self, bounds):
+        # indices of the tiles a bounding box overlaps
+        x0, y0, x1, y1 = bounds
+        if self.RENDER_VERTICALLY:
+            x0, y0, x1, y1 = y0, x0, y1, x1
+        if y1 < 0 or y0 >= self.TILESIZE:
+            return range(0)
+        first = max(int(x0 // self.TILESIZE), 0)
+        last = min(int(x1 // self.TILESIZE), len(self.text) - 1)
+        return range(first, last + 1)
+
+    def touch_tiles(self, bounds):
+        # mark the tiles under a committed stroke as changed
+        for i in self.tiles_in_bounds(bounds):
+            self.revision += 1
+            self.tile_revisions[i] = self.revision
+            self.tile_inked[i] = True
+
+    def retouch_tiles(self):
+        # mark the tiles the kept strokes land on, so ink survives a new
+        # text or orientation laying the tiles out differently
+        for stroke in self.paths:
+            if len(stroke):
+                x0, y0 = stroke.min(axis=0)
+                x1, y1 = stroke.max(axis=0)
+                self.touch_tiles(
+                    self.union_bounds(
+                        self.damage_point(x0, y0), self.damage_point(x1, y1)
+                    )
+                )
+
+    def damage_point(self, x, y):
+        # bounds a stroke through (x, y) can paint, antialiasing included
+        pad = self.INK_WIDTH / 2 + 2
+        return (x - pad, y - pad, x + pad, y + pad)
+
+    def union_bounds(self, a, b):
+        if a is None:
+            return b
+        return (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+
+    def queue_draw_bounds(self, bounds):
+        x0, y0 = int(bounds[0]), int(bounds[1])
+        x1, y1 = int(bounds[2]) + 1, int(bounds[3]) + 1
+        self.queue_draw_area(x0, y0, x1 - x0, y1 - y0)
 
     def ensure_backing_store(self, widget):
-        alloc = widget.get_allocation()
-        width, height = alloc.width, alloc.height
+        # the guide text for the line is exactly this size, whatever
+        # space the widget has been allocated
+        if self.RENDER_VERTICALLY:
+            width, height = self.TILESIZE, len(self.text) * self.TILESIZE
+        else:
+            width, height = len(self.text) * self.TILESIZE, self.TILESIZE
 
         # Check if we need to (re)create the backing store
         if (
@@ -104,33 +214,109 @@ class DrawingArea(Gtk.DrawingArea):
                 tile_height=self.TILESIZE,
             )
 
-            if self.RENDER_VERTICALLY:
-                for i in range(len(self.text)):
-                    self.backing_store = cs.apply_horizontal_rule(
-                        surface,
-                        y_offset=i * self.TILESIZE,
-                        rules=self.RULES,
-                    )
-            else:
-                self.backing_store = cs.apply_horizontal_rule(
-                    surface,
-                    rules=self.RULES,
-                )
-            cr = cairo.Context(self.backing_store)
+            self.backing_store = cs.apply_guides(
+                surface,
+                tile_width=self.TILESIZE,
+                tile_height=self.TILESIZE,
+                rules=self.RULES,
+            )
+
+    def ensure_ink(self):
+        alloc = self.get_allocation()
+        width, height = alloc.width, alloc.height
 
-    def draw_paths(self, cr):
+        # (re)create the ink layer when missing or resized, replaying the
+        # finished paths only then
+        if (
+            self.ink is None
+            or self.ink.get_width() != width
+            or self.ink.get_height() != height
+        ):
+            self.ink = cairo.ImageSurface(cairo.FORMAT_ARGB32, width, height)
+            cr = cairo.Context(self.ink)
+            for path in self.paths:
+                self.draw_path(cr, path)
+        return self.ink
+
+    def clear_paths(self):
+        self.paths.clear()
+        self.stroke_bounds = None
+        self.reset_tiles()
+        self.ink = None
+        self.queue_draw()
+
+    def draw_path(self, cr, path):
         # Set drawing properties for user paths
-        cr.set_source_rgb(0, 0, 0)  # Drawing in black
-        cr.set_line_width(4)  # Example line width
-        for path in self.paths:
-            if path:
-                cr.move_to(path[0][0], path[0][1])
-                for x, y in path[1:]:
-                    cr.line_to(x, y)
-                cr.stroke()
+        if len(path):
+            # one conversion to floats; walking the float32 rows one by
+            # one costs far more per point than the cairo calls
+            points = path.tolist()
+            cr.set_source_rgb(0, 0, 0)  # Drawing in black
+            cr.set_line_width(self.INK_WIDTH)
+            cr.move_to(*points[0])
+            for x, y in points[1:]:
+                cr.line_to(x, y)
+            cr.stroke()
+
+
+class LinePrefetcher:
+    # renders surfaces on a worker thread ahead of being asked for them,
+    # keeping the most recently used ones; each key maps to a future, so
+    # asking for a line the worker is rendering waits for it instead of
+    # rendering it twice
+    def __init__(self, render, capacity=8):
+        self.render = render  # key -> cairo.ImageSurface
+        self.capacity = capacity
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.cache = OrderedDict()
+
+    def get(self, key):
+        # the rendered surface for key, from the cache when possible; a
+        # line not yet started is rendered right here, after dropping the
+        # queued prefetches so the worker is free by the next request
+        future = self.cache.get(key)
+        if (
+            future is None
+            or future.cancelled()
+            or not (future.running() or future.done())
+        ):
+            self.cancel_pending()
+            future = Future()
+            future.set_result(self.render(key))
+            self.store(key, future)
+        self.cache.move_to_end(key)
+        return future.result()
+
+    def prefetch(self, keys):
+        # queue rendering of keys not already cached or in flight
+        for key in keys:
+            if key not in self.cache:
+                self.submit(key)
+
+    def submit(self, key):
+        future = self.executor.submit(self.render, key)
+        self.store(key, future)
+        return future
+
+    def store(self, key, future):
+        self.cache[key] = future
+        while len(self.cache) > self.capacity:
+            _, evicted = self.cache.popitem(last=False)
+            evicted.cancel()
+
+    def cancel_pending(self):
+        # forget queued renders; the one already running is kept
+        for key, future in list(self.cache.items()):
+            if future.cancel():
+                del self.cache[key]
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
 
 
 class shuji(Gtk.Window):
+    PREFETCH_LINES = 2  # lines on either side rendered ahead of navigation
+
     def __init__(
         self,
         fontsize=72,
@@ -144,10 +330,31 @@ class shuji(Gtk.Window):
         self.TILESIZE = tilesize
         self.RULES = rules
         self.index = 0
+        self.green_tiles = {}  # feedback tiles for correctly written chars
+
+        # ocr runs on a background worker so the window keeps responding;
+        # results from an evaluation older than self.evaluation are dropped
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.evaluation = 0
+        self.evaluating = False
+        self.cancel_event = threading.Event()  # set to stop the running job
+        self.feedback_chars = []
+        # tile index -> (tile revision, char) of its last reading
+        self.tile_results = {}
+        self.connect("destroy", self.on_destroy)
 
         self.fulltext = fulltext
         self.TEXT = fulltext[self.index]
 
+        # parse the font once up front; guide text and evaluation share it
+        cs.preload_fonts([self.FONTSIZE])
+
+        # guide surfaces for the lines around the current one are rendered
+        # in the background, so moving between lines is a cache lookup
+        self.prefetcher = LinePrefetcher(
+            self.render_guide_key, capacity=2 * self.PREFETCH_LINES + 3
+        )
+
         # Create a VBox to stack the drawing area and the buttons vertically
         vbox = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=6)
         self.add(vbox)
@@ -169,9 +376,9 @@ class shuji(Gtk.Window):
         toggle_orient_button.connect("clicked", self.on_toggle_orient)
         button_box.pack_start(toggle_orient_button, True, True, 0)
 
-        evaluate_button = Gtk.Button(label="Evaluate")
-        evaluate_button.connect("clicked", self.on_evaluate_clicked)
-        button_box.pack_start(evaluate_button, True, True, 0)
+        self.evaluate_button = Gtk.Button(label="Evaluate")
+        self.evaluate_button.connect("clicked", self.on_evaluate_clicked)
+        button_box.pack_start(self.evaluate_button, True, True, 0)
 
         prev_button = Gtk.Button(label="Prev Line")
         prev_button.connect("clicked", self.on_prev_clicked)
@@ -190,6 +397,7 @@ class shuji(Gtk.Window):
         )
         self.drawing_area.change_text(self.TEXT or "しゅじ")
         vbox.pack_start(self.drawing_area, True, True, 0)
+        self.prefetch_lines()
 
     def save_paths_to_surface(self, paths):
         # Assume WIDTH and HEIGHT are defined as the dimensions of the drawing area
@@ -204,203 +412,251 @@ class shuji(Gtk.Window):
                 self.TILESIZE,
             )
 
-        # Create a new surface and draw paths onto it
-        surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, WIDTH, HEIGHT)
+        # Create a new surface and draw paths onto it; ocr slices its tiles
+        # out as views, without copying
+        surface = cs.create_line_surface(WIDTH, HEIGHT)
         cr = cairo.Context(surface)
 
         # Optionally set a white background if your paths are not exclusively black-and-white
         cr.set_source_rgb(1, 1, 1)  # White background
         cr.paint()
 
-        # Set drawing color to black for the paths
-        cr.set_source_rgb(0, 0, 0)  # Black
-        cr.set_line_width(4)  # Example line width
+        # Composite the already rasterized ink over it
+        cr.set_source_surface(self.drawing_area.ensure_ink(), 0, 0)
+        cr.paint()
+
+        return surface
 
-        # Draw all paths from self.drawing_area.paths
-        for path in self.drawing_area.paths:
-            if path:
-                cr.move_to(path[0][0], path[0][1])
-                for x, y in path[1:]:
-                    cr.line_to(x, y)
-                cr.stroke()
+    def guide_key(self, index):
+        # everything the guide surface of a line depends on
+        return (
+            self.fulltext[index],
+            self.drawing_area.RENDER_VERTICALLY,
+            self.FONTSIZE,
+            self.TILESIZE,
+            tuple(self.RULES),
+        )
 
+    def render_guide_key(self, key):
+        # guide text for a line with the rules laid over it; runs on the
+        # prefetch worker, so it only reads what is in the key
+        text, render_vertically, font_size, tile_size, rules = key
+        surface = cs.render_string(
+            text,
+            render_vertically=render_vertically,
+            font_size=font_size,
+            tile_width=tile_size,
+            tile_height=tile_size,
+        )
+        return cs.apply_guides(
+            surface,
+            tile_width=tile_size,
+            tile_height=tile_size,
+            rules=rules,
+        )
+
+    def render_guide_text(self):
+        # guide text for the current line, prefetched when possible
+        surface = self.prefetcher.get(self.guide_key(self.index))
+        self.prefetch_lines()
         return surface
 
+    def prefetch_lines(self):
+        # nearest lines first, alternating after and before the current one
+        keys = []
+        for distance in range(1, self.PREFETCH_LINES + 1):
+            for step in (distance, -distance):
+                key = self.guide_key((self.index + step) % len(self.fulltext))
+                if key not in keys:
+                    keys.append(key)
+        self.prefetcher.prefetch(keys)
+
+    def on_destroy(self, widget):
+        self.cancel_event.set()
+        self.executor.shutdown(wait=False)
+        self.prefetcher.shutdown()
+
     # Button event handlers
     def on_clear_clicked(self, button):
         # Clear the drawing area of user paths
-        self.drawing_area.paths = []
-        self.drawing_area.current_path = []
+        self.cancel_evaluation()
+        self.drawing_area.clear_paths()
 
     def on_toggle_orient(self, button):
         # reorient application
+        self.cancel_evaluation()
         self.drawing_area.RENDER_VERTICALLY = not self.drawing_area.RENDER_VERTICALLY
 
-        surface = cs.render_string(
-            self.TEXT,
+        self.drawing_area.surface = self.render_guide_text()
+        self.drawing_area.change_text(self.TEXT, self.drawing_area.surface)
+
+    def on_evaluate_clicked(self, button):
+        # Evaluate the drawing via ocr: rasterize the ink once here, then
+        # recognize its tiles on the worker and paint each as it arrives.
+        # Tiles without ink read as blank and tiles unchanged since their
+        # last reading reuse it, so only rewritten tiles reach ocr
+        if self.evaluating:
+            return
+
+        revisions = list(self.drawing_area.tile_revisions)
+        self.feedback_chars = []
+        changed = []
+        for i, revision in enumerate(revisions):
+            if not self.drawing_area.tile_inked[i]:
+                self.feedback_chars.append(" ")
+            elif self.tile_results.get(i, (None,))[0] == revision:
+                self.feedback_chars.append(self.tile_results[i][1])
+            else:
+                self.feedback_chars.append(None)
+                changed.append(i)
+
+        self.evaluation += 1
+        evaluation = self.evaluation
+        if not changed:
+            self.show_feedback(self.feedback_chars)
+            return
+
+        surface = self.save_paths_to_surface(self.drawing_area.paths)
+        self.cancel_event = threading.Event()
+        self.evaluating = True
+        self.evaluate_button.set_sensitive(False)
+        self.show_feedback(self.feedback_chars)
+        self.show_progress()
+
+        def on_result(index, result):
+            # worker thread: hand the result to the main loop
+            GLib.idle_add(
+                self.on_tile_evaluated, evaluation, index, revisions[index], result
+            )
+
+        future = self.executor.submit(
+            cs.ocr_tiles,
+            surface,
+            tile_count=len(self.TEXT),
             render_vertically=self.drawing_area.RENDER_VERTICALLY,
+            indices=changed,
+            callback=on_result,
+            cancel=self.cancel_event,
+        )
+        future.add_done_callback(
+            lambda f: GLib.idle_add(self.on_evaluation_done, evaluation, f)
+        )
+
+    def on_tile_evaluated(self, evaluation, index, revision, result):
+        # main loop: paint one recognized tile into the feedback line
+        if evaluation == self.evaluation:
+            self.feedback_chars[index] = self.result_to_char(result)
+            self.tile_results[index] = (revision, self.feedback_chars[index])
+            self.show_feedback(self.feedback_chars)
+            self.show_progress()
+        return False  # run once
+
+    def on_evaluation_done(self, evaluation, future):
+        # main loop: re-arm unless the run was cancelled, which already did
+        if future.exception():
+            print(f"Error evaluating writing: {future.exception()}")
+        if evaluation == self.evaluation:
+            self.rearm_evaluate()
+        return False  # run once
+
+    def rearm_evaluate(self):
+        self.evaluating = False
+        self.evaluate_button.set_label("Evaluate")
+        self.evaluate_button.set_sensitive(True)
+
+    def cancel_evaluation(self):
+        # drop any results still on their way for the previous line, stop
+        # the running job before its next nhocr call, and let the new line
+        # be evaluated straight away
+        self.evaluation += 1
+        if self.evaluating:
+            self.cancel_event.set()
+            self.rearm_evaluate()
+
+    def show_progress(self):
+        done = sum(c is not None for c in self.feedback_chars)
+        self.evaluate_button.set_label(f"Evaluating {done}/{len(self.feedback_chars)}")
+
+    def result_to_char(self, result):
+        # failed readings, multi-char readings and backslashes
+        # are all thrown away for a space
+        retval = result.text
+        if retval is None or len(retval) != 1 or ord(retval) in [92]:
+            return " "
+        return retval
+
+    def feedback_tile(self, index, char):
+        # recognized glyph, in green where it matches the guide text
+        tile = cs.draw_character(
+            char,
             font_size=self.FONTSIZE,
             tile_width=self.TILESIZE,
             tile_height=self.TILESIZE,
         )
+        if char != self.TEXT[index]:
+            return tile
 
-        if self.drawing_area.RENDER_VERTICALLY:
-            for i in range(len(self.TEXT)):
-                surface = cs.apply_horizontal_rule(
-                    surface,
-                    y_offset=(i * self.TILESIZE),
-                    rules=self.RULES,
-                )
-        else:
-            surface = cs.apply_horizontal_rule(
-                surface,
-                rules=self.RULES,
-            )
-        self.drawing_area.surface = surface
-        self.drawing_area.change_text(self.TEXT)
+        key = (char, self.FONTSIZE, self.TILESIZE)
+        if key not in self.green_tiles:
+            self.green_tiles[key] = cs.paint_grayscale_to_green(tile)
+        return self.green_tiles[key]
 
-    def on_evaluate_clicked(self, button):
-        # Evaluate the drawing via ocr
-        width, height = self.TILESIZE, self.TILESIZE
-
-        chars = []
-        for i in range(len(self.TEXT)):
-            surface = self.save_paths_to_surface(self.drawing_area.paths)
-            retval = cs.ocr_by_index(surface, i)
-            try:
-                if ord(retval) not in [92]:
-                    chars.append(retval)
-            except TypeError:
-                # typeerror found if two chars in string.
-                # should never be the case in ocr_by_index
-                # so throw it away for a space
-                chars.append(" ")
-
-        # get an imagesurface for all characters
+    def show_feedback(self, chars):
         tiles = []
         for i, c in enumerate(chars):
-            tile = cs.draw_character(
-                c,
-                font_size=self.FONTSIZE,
-                tile_width=width,
-                tile_height=height,
-            )
-            if c == self.TEXT[i]:
-                tiles.append(cs.paint_grayscale_to_green(tile))
-            else:
-                tiles.append(tile)
-
-        if self.drawing_area.RENDER_VERTICALLY:
-            new_surface = cs.create_blank(
-                cairo.FORMAT_ARGB32, width, height * len(tiles)
-            )
-        else:
-            new_surface = cs.create_blank(
-                cairo.FORMAT_ARGB32, width * len(tiles), height
-            )
-
-        for i, tile in enumerate(tiles):
-            if self.drawing_area.RENDER_VERTICALLY:
-                new_surface = cs.stack_surfaces(new_surface, tile, y_offset=height * i)
+            if c is None:  # still awaiting a reading, keep the guide glyph
+                tiles.append(
+                    cs.draw_character(
+                        self.TEXT[i],
+                        font_size=self.FONTSIZE,
+                        tile_width=self.TILESIZE,
+                        tile_height=self.TILESIZE,
+                    )
+                )
             else:
-                new_surface = cs.stack_surfaces(new_surface, tile, x_offset=width * i)
+                tiles.append(self.feedback_tile(i, c))
+        new_surface = cs.composite_tiles(
+            tiles,
+            self.TILESIZE,
+            self.TILESIZE,
+            render_vertically=self.drawing_area.RENDER_VERTICALLY,
+        )
 
-        if self.drawing_area.RENDER_VERTICALLY:
-            for i in range(len(self.TEXT)):
-                new_surface = cs.apply_horizontal_rule(
-                    new_surface,
-                    y_offset=(i * self.TILESIZE),
-                    rules=self.RULES,
-                )
-        else:
-            new_surface = cs.apply_horizontal_rule(
-                new_surface,
-                rules=self.RULES,
-            )
-        self.drawing_area.surface = new_surface
+        self.drawing_area.surface = cs.apply_guides(
+            new_surface,
+            tile_width=self.TILESIZE,
+            tile_height=self.TILESIZE,
+            rules=self.RULES,
+        )
         self.drawing_area.queue_draw()
 
     def on_reset_clicked(self, button):
         # Reset the drawing to its original state
-        surface = cs.render_string(
-            self.TEXT,
-            render_vertically=self.drawing_area.RENDER_VERTICALLY,
-            font_size=self.FONTSIZE,
-            tile_width=self.TILESIZE,
-            tile_height=self.TILESIZE,
-        )
-        for i in range(len(self.TEXT)):
-            surface = cs.apply_horizontal_rule(
-                surface,
-                y_offset=(
-                    i * self.TILESIZE if self.drawing_area.RENDER_VERTICALLY else 0
-                ),
-                rules=self.RULES,
-            )
-        self.drawing_area.surface = surface
+        self.cancel_evaluation()
+        self.drawing_area.surface = self.render_guide_text()
         self.drawing_area.queue_draw()
 
     def on_next_clicked(self, button):
         # Reset the drawing to its original state
-        self.drawing_area.paths = []
-        self.drawing_area.current_path = []
+        self.cancel_evaluation()
+        self.drawing_area.clear_paths()
 
         self.index = (self.index + 1) % len(self.fulltext)
         self.TEXT = self.fulltext[self.index]
 
-        surface = cs.render_string(
-            self.TEXT,
-            render_vertically=self.drawing_area.RENDER_VERTICALLY,
-            font_size=self.FONTSIZE,
-            tile_width=self.TILESIZE,
-            tile_height=self.TILESIZE,
-        )
-
-        if self.drawing_area.RENDER_VERTICALLY:
-            for i in range(len(self.TEXT)):
-                surface = cs.apply_horizontal_rule(
-                    surface,
-                    y_offset=(i * self.TILESIZE),
-                    rules=self.RULES,
-                )
-        else:
-            surface = cs.apply_horizontal_rule(
-                surface,
-                rules=self.RULES,
-            )
-        self.drawing_area.surface = surface
-        self.drawing_area.change_text(self.TEXT)
+        self.drawing_area.surface = self.render_guide_text()
+        self.drawing_area.change_text(self.TEXT, self.drawing_area.surface)
 
     def on_prev_clicked(self, button):
         # Reset the drawing to its original state
-        self.drawing_area.paths = []
-        self.drawing_area.current_path = []
+        self.cancel_evaluation()
+        self.drawing_area.clear_paths()
 
         self.index = (self.index - 1) % len(self.fulltext)
         self.TEXT = self.fulltext[self.index]
 
-        surface = cs.render_string(
-            self.TEXT,
-            render_vertically=self.drawing_area.RENDER_VERTICALLY,
-            font_size=self.FONTSIZE,
-            tile_width=self.TILESIZE,
-            tile_height=self.TILESIZE,
-        )
-
-        if self.drawing_area.RENDER_VERTICALLY:
-            for i in range(len(self.TEXT)):
-                surface = cs.apply_horizontal_rule(
-                    surface,
-                    y_offset=(i * self.TILESIZE),
-                    rules=self.RULES,
-                )
-        else:
-            surface = cs.apply_horizontal_rule(
-                surface,
-                rules=self.RULES,
-            )
-        self.drawing_area.surface = surface
-        self.drawing_area.change_text(self.TEXT)
+        self.drawing_area.surface = self.render_guide_text()
+        self.drawing_area.change_text(self.TEXT, self.drawing_area.surface)
 
 
 if __name__ == "__main__":
@@ -415,6 +671,41 @@ if __name__ == "__main__":
         "です",  # desu - is (polite).
     ]
 
+    # SHUJI_TRACE=trace.json times the pipeline and these handlers; they
+    # are wrapped before the window exists so the wrapped ones get connected
+    tracing = trace_cs.enable_from_env()
+    if tracing:
+        trace_cs.instrument(
+            DrawingArea,
+            [
+                "on_draw",
+                "on_button_press",
+                "on_motion_notify",
+                "on_button_release",
+                "ensure_backing_store",
+                "ensure_ink",
+            ],
+            "DrawingArea",
+        )
+        trace_cs.instrument(
+            shuji,
+            [
+                "on_evaluate_clicked",
+                "on_tile_evaluated",
+                "on_evaluation_done",
+                "show_feedback",
+                "save_paths_to_surface",
+                "render_guide_text",
+                "render_guide_key",
+                "on_clear_clicked",
+                "on_toggle_orient",
+                "on_reset_clicked",
+                "on_next_clicked",
+                "on_prev_clicked",
+            ],
+            "shuji",
+        )
+
     app = shuji(
         fontsize=144,
         render_vertically=False,
@@ -425,3 +716,6 @@ if __name__ == "__main__":
     app.connect("destroy", Gtk.main_quit)
     app.show_all()
     Gtk.main()
+
+    if tracing:
+        trace_cs.report()
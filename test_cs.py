@@ -9,6 +9,22 @@ def is_nhocr_available():
     return shutil.which("nhocr") is not None
 
 
+def write_stub_nhocr(directory, script):
+    """
+    Write an executable shell script standing in for nhocr and return its path.
+
+    :param directory: directory to place the stub in
+    :param script: body of the shell script, after the shebang line
+    """
+    import os
+
+    stub = os.path.join(directory, "nhocr")
+    with open(stub, "w") as f:
+        f.write("#!/bin/sh\n" + script)
+    os.chmod(stub, 0o755)
+    return stub
+
+
 class TestCharacterSurfaceCreation(unittest.TestCase):
     def setUp(self):
         pass
@@ -957,6 +973,980 @@ R	10	ヒ	0	0	3.5937597e+00"""
                 else:  # Where there was no text, expecting full transparency
                     self.assertEqual(a, 0)
 
+    def test_glyph_cache_hits_and_misses(self):
+        cache = cs.GlyphCache()
+        key = ("は", cs.FONT_PATH, 72, 127, 100, 100)
+        self.assertIsNone(cache.get(key))
+
+        surface = cs.create_blank(cairo.FORMAT_ARGB32, 100, 100)
+        cache.put(key, surface)
+        self.assertIs(cache.get(key), surface)
+
+        stats = cache.stats()
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["bytes"], surface.get_stride() * 100)
+
+    def test_glyph_cache_evicts_least_recent(self):
+        tile_bytes = (
+            cairo.ImageSurface.format_stride_for_width(cairo.FORMAT_ARGB32, 100) * 100
+        )
+        cache = cs.GlyphCache(max_bytes=tile_bytes * 2)
+
+        for c in "あいう":
+            cache.put(c, cs.create_blank(cairo.FORMAT_ARGB32, 100, 100))
+
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.stats()["evictions"], 1)
+        self.assertIsNone(cache.get("あ"))
+        self.assertIsNotNone(cache.get("う"))
+
+    def test_draw_character_uses_glyph_cache(self):
+        cs.GLYPH_CACHE.clear()
+        first = cs.draw_character("は")
+        second = cs.draw_character("は")
+        self.assertIs(first, second)
+        self.assertEqual(cs.GLYPH_CACHE.stats()["hits"], 1)
+
+        uncached = cs.draw_character("は", use_cache=False)
+        self.assertIsNot(uncached, first)
+        self.assertTrue(cs.white_pixels_match(uncached, first))
+
+    def test_load_font_is_shared(self):
+        font = cs.load_font(cs.FONT_PATH, 72)
+        self.assertIs(cs.load_font(cs.FONT_PATH, 72), font)
+        self.assertIsNot(cs.load_font(cs.FONT_PATH, 36), font)
+
+        cs.preload_fonts([144])
+        self.assertIn((cs.FONT_PATH, 144), cs._FONT_REGISTRY)
+
+    def test_draw_character_cairo_engine(self):
+        new_surface = cs.draw_character("は", engine="cairo", use_cache=False)
+        self.assertEqual(new_surface.get_width(), cs.TILE_WIDTH)
+        self.assertEqual(new_surface.get_height(), cs.TILE_HEIGHT)
+
+        # same spot checks as the PIL engine
+        self.assertFalse(cs.is_pixel_white(new_surface, 0, 0))
+        self.assertFalse(cs.is_pixel_white(new_surface, 1, 0))
+        self.assertFalse(cs.is_pixel_white(new_surface, 25, 35))
+        self.assertFalse(cs.is_pixel_white(new_surface, 60, 40))
+
+    def test_render_string_cairo_engine(self):
+        text_str = "こんにちわ"
+        surface = cs.render_string(text_str, engine="cairo")
+        self.assertEqual(surface.get_width(), 500)
+        self.assertEqual(surface.get_height(), 100)
+
+        for i, c in enumerate(text_str):
+            new_tile = cs.stack_surfaces(
+                cs.create_blank(cairo.FORMAT_ARGB32, cs.TILE_WIDTH, cs.TILE_HEIGHT),
+                cs.draw_character(c, engine="cairo"),
+            )
+            extracted = cs.extract_rectangle(
+                surface, i * cs.TILE_WIDTH, 0, cs.TILE_WIDTH, cs.TILE_HEIGHT
+            )
+            self.assertTrue(cs.white_pixels_match(extracted, new_tile))
+
+    def test_draw_character_unknown_engine(self):
+        with self.assertRaises(ValueError):
+            cs.draw_character("は", engine="skia")
+
+    def test_composite_tiles_matches_stacking(self):
+        text_str = "こんにちわ"
+        tiles = [cs.draw_character(c) for c in text_str]
+
+        for vertical in (False, True):
+            with self.subTest(render_vertically=vertical):
+                surface = cs.composite_tiles(
+                    tiles, cs.TILE_WIDTH, cs.TILE_HEIGHT, render_vertically=vertical
+                )
+                if vertical:
+                    reference = cs.create_blank(
+                        cairo.FORMAT_ARGB32, cs.TILE_WIDTH, cs.TILE_HEIGHT * 5
+                    )
+                    for i, tile in enumerate(tiles):
+                        cs.stack_surfaces(reference, tile, y_offset=100 * i)
+                else:
+                    reference = cs.create_blank(
+                        cairo.FORMAT_ARGB32, cs.TILE_WIDTH * 5, cs.TILE_HEIGHT
+                    )
+                    for i, tile in enumerate(tiles):
+                        cs.stack_surfaces(reference, tile, x_offset=100 * i)
+
+                self.assertEqual(surface.get_width(), reference.get_width())
+                self.assertEqual(surface.get_height(), reference.get_height())
+                self.assertTrue(cs.white_pixels_match(surface, reference))
+
+    def test_surface_array_shares_memory(self):
+        surface = cs.composite_tiles([cs.draw_character("は")])
+        arr = cs.surface_array(surface)
+        self.assertEqual(arr.shape, (cs.TILE_HEIGHT, cs.TILE_WIDTH, 4))
+
+        arr[0, 0] = (0, 0, 0, 255)
+        surface.mark_dirty()
+        self.assertFalse(cs.is_pixel_white(surface, 0, 0))
+        self.assertTrue(cs.is_pixel_white(surface, 1, 0))
+
+    def test_apply_guides_every_tile(self):
+        for vertical in (False, True):
+            with self.subTest(render_vertically=vertical):
+                surface = cs.render_string("にに", render_vertically=vertical)
+                cs.apply_guides(surface)
+
+                for i in range(2):
+                    x0, y0 = (0, i * 100) if vertical else (i * 100, 0)
+                    for y in [20, 80]:
+                        # dash on
+                        self.assertFalse(cs.is_pixel_white(surface, x0, y0 + y))
+                        self.assertFalse(cs.is_pixel_white(surface, x0 + 1, y0 + y))
+                        # dash off
+                        self.assertTrue(cs.is_pixel_white(surface, x0 + 2, y0 + y))
+                        self.assertTrue(cs.is_pixel_white(surface, x0 + 3, y0 + y))
+
+    def test_guide_pattern_is_cached(self):
+        pattern = cs.guide_pattern(100, 100, [20, 80])
+        self.assertIs(cs.guide_pattern(100, 100, (20, 80)), pattern)
+        self.assertIsNot(cs.guide_pattern(100, 100, [20, 80], True), pattern)
+
+    def test_apply_guides_bounding_box(self):
+        surface = cs.create_blank(cairo.FORMAT_ARGB32, cs.TILE_WIDTH * 2, 100)
+        cs.apply_guides(surface, bounding_box=True)
+
+        for y in [10, 90]:
+            for x in range(0, cs.TILE_WIDTH * 2):
+                self.assertFalse(cs.is_pixel_white(surface, x, y))
+        for y in range(10, 90):
+            for x in [0, 99, 100, 199]:
+                self.assertFalse(cs.is_pixel_white(surface, x, y))
+
+    def test_a8_to_inverted_argb32(self):
+        import numpy as np
+
+        gray = np.array([[0, 128, 255], [255, 64, 0]], dtype=np.uint8)
+        surface = cs.a8_to_inverted_argb32(gray)
+        self.assertEqual(surface.get_format(), cairo.FORMAT_ARGB32)
+        self.assertEqual((surface.get_width(), surface.get_height()), (3, 2))
+
+        arr = cs.surface_array(surface)
+        self.assertTrue(np.array_equal(arr[..., 0], gray))
+        self.assertTrue(np.array_equal(arr[..., 1], gray))
+        self.assertTrue(np.array_equal(arr[..., 2], gray))
+        self.assertTrue((arr[..., 3] == 255).all())
+
+        # A8 surfaces are accepted as well, stride padding included
+        a8 = cairo.ImageSurface(cairo.FORMAT_A8, 3, 2)
+        a8_view = np.ndarray(
+            shape=(2, 3),
+            dtype=np.uint8,
+            buffer=a8.get_data(),
+            strides=(a8.get_stride(), 1),
+        )
+        a8_view[...] = gray
+        a8.mark_dirty()
+        from_surface = cs.surface_array(cs.a8_to_inverted_argb32(a8))
+        self.assertTrue(np.array_equal(from_surface, arr))
+
+    def test_pgm_bytes_matches_pgm_file(self):
+        import tempfile
+
+        surface = cs.render_string("にに", font_alpha=255)
+        encoded = cs.pgm_bytes(surface)
+        self.assertTrue(encoded.startswith(b"P5\n200 100\n255\n"))
+        self.assertEqual(len(encoded), len(b"P5\n200 100\n255\n") + 200 * 100)
+
+        with tempfile.NamedTemporaryFile(suffix=".pgm", delete=True) as tmpfile:
+            cs.surface_to_pgm(surface, tmpfile.name)
+            with open(tmpfile.name, "rb") as f:
+                self.assertEqual(f.read(), encoded)
+
+        # grayscale arrays encode the same way
+        self.assertEqual(cs.pgm_bytes(cs.surface_to_grayscale(surface)), encoded)
+
+    @unittest.skipIf(not is_nhocr_available(), "nhocr not found in path, skipping test")
+    def test_ocr_in_memory_inputs(self):
+        target_char = "に"
+        surface = cs.render_string(
+            target_char,
+            font_size=144,
+            tile_width=200,
+            tile_height=200,
+            font_alpha=255,
+        )
+
+        self.assertEqual(cs.ocr(surface, single_char_reading=True), target_char)
+        self.assertEqual(
+            cs.ocr(cs.surface_to_grayscale(surface), single_char_reading=True),
+            target_char,
+        )
+
+    def test_ocr_batch_captures_errors(self):
+        import tempfile
+        from unittest import mock
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            stub = write_stub_nhocr(tmpdir, "echo 'cannot open image' >&2\nexit 1\n")
+
+            tiles = [cs.render_string(c) for c in "にに"]
+            with mock.patch.object(cs, "NHOCR_COMMAND", stub):
+                results = cs.ocr_batch(tiles, max_workers=2)
+
+        self.assertEqual(len(results), 2)
+        for result in results:
+            self.assertIsNone(result.text)
+            self.assertIn("cannot open image", result.error)
+
+    @unittest.skipIf(not is_nhocr_available(), "nhocr not found in path, skipping test")
+    def test_ocr_batch_preserves_order(self):
+        text_str = "ものがたり"
+        tiles = [
+            cs.render_string(
+                c, font_size=144, tile_width=200, tile_height=200, font_alpha=255
+            )
+            for c in text_str
+        ]
+
+        results = cs.ocr_batch(tiles, max_workers=3)
+        self.assertEqual("".join(r.text for r in results), text_str)
+        self.assertTrue(all(r.error is None for r in results))
+
+    def test_ocr_batch_groups_images_per_process(self):
+        import os
+        import tempfile
+        from unittest import mock
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            log = os.path.join(tmpdir, "calls.log")
+            stub = write_stub_nhocr(
+                tmpdir,
+                "shift 3\n"
+                f"echo $# >> {log}\n"
+                "i=0\n"
+                'for f in "$@"; do\n'
+                "  printf 'IMG\\t%d\\nR\\t1\\tに\\t0\\t0\\t1.0\\n' $i\n"
+                "  i=$((i+1))\n"
+                "done\n",
+            )
+
+            tiles = [cs.render_string(c) for c in "にににに"]
+            with mock.patch.object(cs, "NHOCR_COMMAND", stub), mock.patch.object(
+                cs, "OCR_CACHE", cs.OcrCache()
+            ):
+                results = cs.ocr_batch(
+                    tiles,
+                    max_workers=1,
+                    images_per_process=4,
+                    backend=cs.NhocrBackend(multi_image=True),
+                )
+
+            with open(log) as f:
+                calls = f.read().split()
+
+        self.assertEqual(calls, ["4"])  # one nhocr process for all four tiles
+        self.assertEqual([r.text for r in results], ["に"] * 4)
+
+    def test_ocr_batch_multi_image_fallback_is_per_group(self):
+        import os
+        import tempfile
+        from unittest import mock
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            log = os.path.join(tmpdir, "calls.log")
+            # answers a group with a single section, which can't be split
+            stub = write_stub_nhocr(
+                tmpdir,
+                f'shift 3; echo "$#" >> {log}\n'
+                "printf 'IMG\\t0\\nR\\t1\\tに\\t0\\t0\\t1.0\\n'\n",
+            )
+            tiles = [cs.render_string(c) for c in "にの"]
+            backend = cs.NhocrBackend(multi_image=True)
+
+            for _ in range(2):
+                with mock.patch.object(cs, "NHOCR_COMMAND", stub), mock.patch.object(
+                    cs, "OCR_CACHE", cs.OcrCache()
+                ):
+                    results = cs.ocr_batch(
+                        tiles, max_workers=1, images_per_process=2, backend=backend
+                    )
+                self.assertEqual([r.text for r in results], ["に"] * 2)
+
+            with open(log) as f:
+                calls = f.read().split()
+
+        # every batch still tries a group before reading images singly
+        self.assertEqual(calls, ["2", "1", "1"] * 2)
+        self.assertTrue(backend.multi_image)
+
+    def test_nhocr_multi_image_is_probed_once(self):
+        import os
+        import tempfile
+        from unittest import mock
+
+        per_image = (
+            'for f in "$@"; do\n'
+            "  printf 'IMG\\t%d\\nR\\t1\\tに\\t0\\t0\\t1.0\\n' $i\n"
+            "  i=$((i+1))\n"
+            "done\n"
+        )
+        single = "printf 'IMG\\t0\\nR\\t1\\tに\\t0\\t0\\t1.0\\n'\n"
+
+        # a command that splits its output is grouped after one probe run,
+        # one that doesn't reads every image singly; both probe only once
+        for script, expected in (
+            (per_image, ["2", "3", "3"]),
+            (single, ["2", "1", "1", "1", "1", "1", "1"]),
+        ):
+            with tempfile.TemporaryDirectory() as tmpdir:
+                log = os.path.join(tmpdir, "calls.log")
+                stub = write_stub_nhocr(
+                    tmpdir, f'shift 3; echo "$#" >> {log}\ni=0\n' + script
+                )
+                tiles = [cs.render_string(c) for c in "にのは"]
+
+                with mock.patch.object(cs, "NHOCR_COMMAND", stub), mock.patch.object(
+                    cs, "_NHOCR_MULTI_IMAGE", {}
+                ):
+                    for _ in range(2):
+                        with mock.patch.object(cs, "OCR_CACHE", cs.OcrCache()):
+                            cs.ocr_batch(
+                                tiles,
+                                max_workers=1,
+                                images_per_process=3,
+                                backend=cs.NhocrBackend(),
+                            )
+
+                with open(log) as f:
+                    self.assertEqual(f.read().split(), expected)
+
+    def test_tile_rectangles(self):
+        self.assertEqual(
+            cs.tile_rectangles(300, 100),
+            [(0, 0, 100, 100), (100, 0, 100, 100), (200, 0, 100, 100)],
+        )
+        self.assertEqual(cs.tile_rectangles(50, 100), [(0, 0, 50, 50), (0, 50, 50, 50)])
+        # explicit count and orientation win over the square-tile guess
+        self.assertEqual(
+            cs.tile_rectangles(100, 100, 2, render_vertically=True),
+            [(0, 0, 100, 50), (0, 50, 100, 50)],
+        )
+
+    @unittest.skipIf(not is_nhocr_available(), "nhocr not found in path, skipping test")
+    def test_ocr_tiles(self):
+        text_str = "ものがたり"
+        for vertical in (False, True):
+            with self.subTest(render_vertically=vertical):
+                surface = cs.render_string(
+                    text_str,
+                    font_size=144,
+                    tile_width=200,
+                    tile_height=200,
+                    font_alpha=255,
+                    render_vertically=vertical,
+                )
+                results = cs.ocr_tiles(surface, len(text_str), vertical)
+                self.assertEqual("".join(r.text for r in results), text_str)
+
+    def test_ocr_batch_async(self):
+        import asyncio
+        import os
+        import tempfile
+        from unittest import mock
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            # fails on any image whose path holds "bad", reads "に" otherwise
+            stub = write_stub_nhocr(
+                tmpdir,
+                'case "$4" in *bad*) echo "cannot open $4"; exit 1;; esac\n'
+                "printf 'IMG\\t0\\nR\\t1\\tに\\t0\\t0\\t1.0\\n'\n",
+            )
+            good = cs.render_string("に")
+            bad = os.path.join(tmpdir, "bad.pgm")
+            cs.surface_to_pgm(good, bad)
+
+            with mock.patch.object(cs, "NHOCR_COMMAND", stub):
+                results = asyncio.run(
+                    cs.ocr_batch_async([good, bad, good], concurrency=2)
+                )
+                single = asyncio.run(cs.ocr_async(good, single_char_reading=True))
+
+        self.assertEqual([r.text for r in results], ["に", None, "に"])
+        self.assertIn("cannot open", results[1].error)
+        self.assertEqual(single, "に")
+
+    def test_ocr_batch_async_timeout_and_cancel(self):
+        import asyncio
+        import tempfile
+        import time
+        from unittest import mock
+
+        async def cancel_soon(coro):
+            task = asyncio.ensure_future(coro)
+            await asyncio.sleep(0.2)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            stub = write_stub_nhocr(tmpdir, "sleep 10\n")
+            tiles = [cs.render_string("に")] * 2
+
+            started = time.monotonic()
+            with mock.patch.object(cs, "NHOCR_COMMAND", stub):
+                results = asyncio.run(cs.ocr_batch_async(tiles, timeout=0.2))
+                asyncio.run(cancel_soon(cs.ocr_batch_async(tiles)))
+
+        self.assertLess(time.monotonic() - started, 5)
+        for result in results:
+            self.assertIsNone(result.text)
+            self.assertIn("timed out", result.error)
+
+    def test_ocr_cache_memory_and_disk_tiers(self):
+        import os
+        import tempfile
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "readings.sqlite")
+            cache = cs.OcrCache(max_entries=2, path=path)
+            keys = [cache.key(bytes([i]), "-mchar") for i in range(3)]
+            self.assertNotEqual(cache.key(b"\0", "-mchar"), cache.key(b"\0", "-line"))
+
+            for i, key in enumerate(keys):
+                cache.put(key, f"R\t1\t{i}\t0\t0\t1.0")
+            self.assertEqual(len(cache), 2)  # oldest reading left memory...
+            self.assertEqual(cache.get(keys[0]), "R\t1\t0\t0\t0\t1.0")  # ...not disk
+            self.assertIsNone(cache.get(cache.key(b"unseen", "-mchar")))
+
+            stats = cache.stats()
+            self.assertEqual(stats["disk_hits"], 1)
+            self.assertEqual(stats["misses"], 1)
+            self.assertAlmostEqual(stats["hit_rate"], 0.5)
+            cache.close_disk()
+
+            # a new session reads the persisted readings
+            reopened = cs.OcrCache(path=path)
+            self.assertEqual(reopened.get(keys[2]), "R\t1\t2\t0\t0\t1.0")
+            reopened.close_disk()
+
+    def test_ocr_batch_skips_cached_tiles(self):
+        import os
+        import tempfile
+        from unittest import mock
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            log = os.path.join(tmpdir, "calls.log")
+            stub = write_stub_nhocr(
+                tmpdir,
+                f"echo call >> {log}\n"
+                "printf 'IMG\\t0\\nR\\t1\\tに\\t0\\t0\\t1.0\\n'\n",
+            )
+            # distinct tiles, so neither can hit on the first pass
+            surface = cs.render_string("にの")
+
+            with mock.patch.object(cs, "NHOCR_COMMAND", stub), mock.patch.object(
+                cs, "OCR_CACHE", cs.OcrCache()
+            ):
+                first = cs.ocr_tiles(surface, images_per_process=1)
+                with open(log) as f:
+                    calls = len(f.read().split())
+                second = cs.ocr_tiles(surface, images_per_process=1)
+                with open(log) as f:
+                    self.assertEqual(len(f.read().split()), calls)
+                self.assertEqual(cs.OCR_CACHE.stats()["memory_hits"], 2)
+
+        self.assertEqual(first, second)
+
+    def test_simplify_polyline(self):
+        import numpy as np
+
+        # collinear interior points go, the corner stays
+        points = np.array([(0, 0), (1, 0), (2, 0), (3, 0), (3, 1), (3, 2)])
+        keep = cs.simplify_polyline(points, epsilon=0.5)
+        self.assertEqual(keep.tolist(), [True, False, False, True, False, True])
+
+    def test_stroke_store(self):
+        store = cs.StrokeStore(min_distance=2, epsilon=0.5, capacity=2)
+        self.assertFalse(store.add_point(0, 0))
+
+        store.begin_stroke(0, 0)
+        self.assertTrue(store.in_stroke)
+        self.assertFalse(store.add_point(1, 0))  # too close to keep
+        for x in range(2, 11, 2):
+            self.assertTrue(store.add_point(x, 0))
+        store.add_point(10, 1)  # decimated, but still ends the stroke
+        stroke = store.end_stroke()
+
+        self.assertFalse(store.in_stroke)
+        self.assertIsNone(store.end_stroke())
+        self.assertEqual(stroke.tolist(), [[0, 0], [10, 0], [10, 1]])
+
+        store.begin_stroke(5, 5)
+        store.add_point(5, 9)
+        store.end_stroke()
+        self.assertEqual(len(store), 2)
+        self.assertEqual(store.point_count, 5)
+        self.assertEqual([len(s) for s in store], [3, 2])
+        self.assertEqual(store[0].tolist(), stroke.tolist())
+        self.assertEqual(store[-1].tolist(), [[5, 5], [5, 9]])
+        with self.assertRaises(IndexError):
+            store[2]
+        with self.assertRaises(IndexError):
+            store[-3]
+
+        store.clear()
+        self.assertEqual(len(store), 0)
+        self.assertEqual(store.point_count, 0)
+
+    def test_ocr_tiles_indices(self):
+        import os
+        import tempfile
+        from unittest import mock
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            log = os.path.join(tmpdir, "calls.log")
+            stub = write_stub_nhocr(
+                tmpdir,
+                f'shift 3; echo "$#" >> {log}\n'
+                "printf 'IMG\\t0\\nR\\t1\\tの\\t0\\t0\\t1.0\\n'\n",
+            )
+            surface = cs.render_string("にの")
+            seen = []
+
+            with mock.patch.object(cs, "NHOCR_COMMAND", stub), mock.patch.object(
+                cs, "OCR_CACHE", cs.OcrCache()
+            ):
+                results = cs.ocr_tiles(
+                    surface, indices=[1], callback=lambda i, result: seen.append(i)
+                )
+            with open(log) as f:
+                calls = f.read().split()
+
+        self.assertIsNone(results[0])
+        self.assertEqual(results[1].text, "の")
+        self.assertEqual(seen, [1])
+        self.assertEqual(calls, ["1"])  # only the requested tile reached nhocr
+
+    def test_template_backend(self):
+        import asyncio
+
+        backend = cs.TemplateBackend(characters="あいうえおにの")
+        surface = cs.render_string("にの")
+        tile = cs.draw_character(
+            "お",
+            cs.FONT_SIZE,
+            cs.FONT_PATH,
+            cs.FONT_ALPHA,
+            cs.TILE_WIDTH,
+            cs.TILE_HEIGHT,
+        )
+
+        self.assertEqual(cs.ocr(surface, backend=backend), "にの")
+        self.assertEqual(cs.ocr(tile, single_char_reading=True, backend=backend), "お")
+        results = cs.ocr_tiles(surface, backend=backend)
+        self.assertEqual([r.text for r in results], ["に", "の"])
+
+        # a tile without ink has no candidates, and reads as a space
+        # through the single-image entry points
+        blank = cs.create_blank(cairo.FORMAT_ARGB32)
+        self.assertIsNone(cs.ocr_batch([blank], backend=backend)[0].text)
+        self.assertEqual(cs.ocr(blank, single_char_reading=True, backend=backend), " ")
+        self.assertEqual(
+            cs.ocr_by_index(cs.render_string(" "), 0, backend=backend), " "
+        )
+        self.assertEqual(
+            asyncio.run(cs.ocr_async(blank, single_char_reading=True, backend=backend)),
+            " ",
+        )
+
+    def test_in_process_backend(self):
+        from unittest import mock
+
+        calls = []
+
+        def recognize(data, mode):
+            calls.append((data[:2], mode))
+            return "R\t1\tに\t0\t0\t1.0\n"
+
+        backend = cs.InProcessBackend(recognize, name="stub")
+        surface = cs.render_string("に")
+        previous = cs.set_ocr_backend(backend)
+        try:
+            self.assertIs(cs.get_ocr_backend(), backend)
+            with mock.patch.object(cs, "OCR_CACHE", cs.OcrCache()):
+                self.assertEqual(cs.ocr(surface, single_char_reading=True), "に")
+                self.assertEqual(calls, [(b"P5", "-mchar")])
+        finally:
+            cs.set_ocr_backend(previous)
+
+        # readings are cached per backend
+        data = cs.pgm_bytes(surface)
+        self.assertNotEqual(
+            cs.OCR_CACHE.key(data, "-mchar", backend),
+            cs.OCR_CACHE.key(data, "-mchar"),
+        )
+        with self.assertRaises(ValueError):
+            cs.get_ocr_backend("tesseract")
+
+        # a backend has to implement recognize()
+        with self.assertRaises(TypeError):
+            cs.OcrBackend()
+
+    def test_tracing(self):
+        import json
+        import os
+        import tempfile
+        import trace_cs
+
+        original = cs.render_string
+        tracer = trace_cs.enable_tracing()
+        try:
+            tracer.clear()
+            self.assertTrue(trace_cs.tracing_enabled())
+            cs.render_string("にの")
+        finally:
+            trace_cs.disable_tracing()
+
+        self.assertIs(cs.render_string, original)
+        stages = [row[0] for row in tracer.summary()]
+        self.assertIn("render_string", stages)
+        self.assertIn("draw_character", stages)
+
+        # nothing is recorded once tracing is off
+        count = len(tracer.spans)
+        cs.render_string("にの")
+        self.assertEqual(len(tracer.spans), count)
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "trace.json")
+            tracer.dump(path)
+            with open(path) as f:
+                events = json.load(f)["traceEvents"]
+        self.assertEqual(len(events), count)
+        self.assertTrue(all(e["ph"] == "X" and e["dur"] >= 0 for e in events))
+
+    def test_grayscale_fixed_point(self):
+        import numpy as np
+
+        # half-covered red over a blue background, in a surface whose rows
+        # are padded past width * 4
+        width, height, stride = 3, 2, 3 * 4 + 16
+        data = bytearray(height * stride)
+        surface = cairo.ImageSurface.create_for_data(
+            data, cairo.FORMAT_ARGB32, width, height, stride
+        )
+        ctx = cairo.Context(surface)
+        ctx.set_source_rgba(1, 0, 0, 0.5)
+        ctx.paint()
+        surface.flush()
+
+        gray = cs.surface_to_grayscale(surface, background_color=(0, 0, 255))
+        b, g, r, a = cs.surface_array(surface)[0, 0]
+        red = r + (255 - a) * 0 / 255
+        blue = b + (255 - a) * 255 / 255
+        expected = 0.299 * red + 0.114 * blue
+        self.assertEqual(gray.shape, (height, width))
+        self.assertTrue(np.all(np.abs(gray.astype(float) - expected) <= 1))
+
+    def test_surface_to_pgm_targets(self):
+        import io
+        import os
+        import threading
+        from unittest import mock
+
+        surface = cs.render_string("にの")
+        encoded = cs.pgm_bytes(surface)
+
+        # small chunks give the same image as one big one
+        with mock.patch.object(cs, "PGM_CHUNK_PIXELS", 1000):
+            self.assertEqual(cs.pgm_bytes(surface), encoded)
+
+        buffer = io.BytesIO()
+        cs.surface_to_pgm(surface, buffer)
+        self.assertEqual(buffer.getvalue(), encoded)
+
+        # and a pipe drained by another thread
+        read_fd, write_fd = os.pipe()
+        piped = []
+
+        def drain():
+            with os.fdopen(read_fd, "rb") as reader:
+                piped.append(reader.read())
+
+        reader = threading.Thread(target=drain)
+        reader.start()
+        cs.surface_to_pgm(surface, write_fd)
+        os.close(write_fd)
+        reader.join()
+        self.assertEqual(piped, [encoded])
+
+    def test_read_pgm(self):
+        import os
+        import tempfile
+        import numpy as np
+
+        # an odd width, so cairo pads the A8 rows
+        surface = cs.render_string("に", tile_width=101, tile_height=100)
+        expected = cs.surface_to_grayscale(surface)
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "tile.pgm")
+            cs.surface_to_pgm(surface, path)
+
+            pixels = cs.read_pgm(path)
+            self.assertEqual(pixels.shape, (100, 101))
+            self.assertFalse(pixels.flags.writeable)  # a view of the mapping
+            np.testing.assert_array_equal(pixels, expected)
+
+            a8 = cs.read_pgm(path, as_surface=True)
+            self.assertEqual(a8.get_format(), cairo.FORMAT_A8)
+            self.assertEqual(a8.get_stride(), 104)
+            rows = np.frombuffer(a8.get_data(), dtype=np.uint8).reshape(100, 104)
+            np.testing.assert_array_equal(rows[:, :101], expected)
+
+            pbm = os.path.join(tmpdir, "bits.pbm")
+            with open(pbm, "wb") as f:
+                f.write(b"P4\n# two rows\n10 2\n" + bytes([0x80, 0x40, 0xFF, 0xC0]))
+            bits = cs.read_pgm(pbm)
+            self.assertEqual(bits[0].tolist(), [0] + [255] * 8 + [0])
+            self.assertEqual(bits[1].tolist(), [0] * 10)
+
+            with open(pbm, "wb") as f:
+                f.write(b"P6\n1 1\n255\n\0\0\0")
+            with self.assertRaises(ValueError):
+                cs.read_pgm(pbm)
+
+    def test_tile_metrics(self):
+        # the default tiles, and the 200px tiles and 144pt font of draw.py
+        # that guess_character_size's threshold was calibrated for
+        for vertical, size, font_size in (
+            (False, cs.TILE_WIDTH, cs.FONT_SIZE),
+            (True, cs.TILE_WIDTH, cs.FONT_SIZE),
+            (False, 200, 144),
+            (True, 200, 144),
+        ):
+            surface = cs.render_string(
+                "にぁ ",
+                render_vertically=vertical,
+                font_size=font_size,
+                tile_width=size,
+                tile_height=size,
+            )
+            metrics = cs.tile_metrics(surface, 3, vertical)
+            rectangles = cs.tile_rectangles(
+                surface.get_width(), surface.get_height(), 3, vertical
+            )
+
+            for (x, y, w, h), tile in zip(rectangles[:2], metrics):
+                bbox = cs.find_tight_bounding_box(
+                    cs.extract_rectangle(surface, x, y, w, h)
+                )
+                self.assertEqual(tile.bbox, tuple(int(v) for v in bbox))
+                self.assertAlmostEqual(
+                    tile.proportion, cs.find_rectangle_proportion(bbox)
+                )
+                self.assertEqual(tile.size, cs.guess_character_size(bbox))
+
+            self.assertEqual(metrics[2], cs.TileMetrics(None, 0.0, None))
+            if size == 200:
+                self.assertEqual([m.size for m in metrics], ["large", "small", None])
+
+        # arrays work the same as surfaces
+        gray = cs.surface_to_grayscale(surface)
+        self.assertEqual(cs.tile_metrics(gray, 3, True), metrics)
+
+    def test_ocr_tiles_skips_blank_tiles(self):
+        import os
+        import tempfile
+        from unittest import mock
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            log = os.path.join(tmpdir, "calls.log")
+            stub = write_stub_nhocr(
+                tmpdir,
+                f'shift 3; echo "$#" >> {log}\n'
+                "printf 'IMG\\t0\\nR\\t1\\tに\\t0\\t0\\t1.0\\n'\n",
+            )
+            surface = cs.render_string(" に ")
+            seen = []
+
+            with mock.patch.object(cs, "NHOCR_COMMAND", stub), mock.patch.object(
+                cs, "OCR_CACHE", cs.OcrCache()
+            ):
+                results = cs.ocr_tiles(
+                    surface, callback=lambda i, result: seen.append(i)
+                )
+            with open(log) as f:
+                calls = f.read().split()
+
+        self.assertEqual([r.text for r in results], [" ", "に", " "])
+        self.assertEqual(sorted(seen), [0, 1, 2])
+        self.assertEqual(calls, ["1"])  # only the written tile reached nhocr
+
+    def test_tile_view(self):
+        import numpy as np
+
+        for vertical in (False, True):
+            surface = cs.render_string("にのは", render_vertically=vertical)
+            line = cs.surface_array(surface)
+            for x, y, w, h in cs.tile_rectangles(
+                surface.get_width(), surface.get_height(), 3, vertical
+            ):
+                view = cs.tile_view(surface, x, y, w, h)
+                self.assertEqual((view.get_width(), view.get_height()), (w, h))
+                self.assertEqual(view.get_stride(), surface.get_stride())
+                pixels = cs.surface_array(view)
+                self.assertTrue(np.may_share_memory(pixels, line))
+                np.testing.assert_array_equal(
+                    pixels, cs.surface_array(cs.extract_rectangle(surface, x, y, w, h))
+                )
+                np.testing.assert_array_equal(
+                    cs.tile_array(surface, x, y, w, h), pixels
+                )
+
+        # without a slack row the last tile can only be copied, but reads the same
+        plain = cairo.ImageSurface(cairo.FORMAT_ARGB32, 300, 100)
+        ctx = cairo.Context(plain)
+        ctx.set_source_surface(cs.render_string("にのは"))
+        ctx.paint()
+        copy = cs.tile_view(plain, 200, 0, 100, 100)
+        self.assertFalse(
+            np.may_share_memory(cs.surface_array(copy), cs.surface_array(plain))
+        )
+        np.testing.assert_array_equal(
+            cs.surface_array(copy), cs.surface_array(plain)[:, 200:]
+        )
+        self.assertTrue(
+            np.may_share_memory(
+                cs.surface_array(cs.tile_view(plain, 0, 0, 100, 100)),
+                cs.surface_array(plain),
+            )
+        )
+
+        # the same holds for a blank line surface made to be sliced
+        line = cs.create_line_surface(300, 100)
+        view = cs.tile_view(line, 200, 0, 100, 100)
+        self.assertTrue(
+            np.may_share_memory(cs.surface_array(view), cs.surface_array(line))
+        )
+
+        # A8 rectangles keep their format whether viewed or copied
+        a8 = cairo.ImageSurface(cairo.FORMAT_A8, 16, 4)
+        stride = a8.get_stride()
+        a8_pixels = np.ndarray((4, 16), np.uint8, a8.get_data(), strides=(stride, 1))
+        a8_pixels[...] = np.arange(64, dtype=np.uint8).reshape(4, 16)
+        a8.mark_dirty()
+        for x in (4, 6):
+            tile = cs.tile_view(a8, x, 0, 8, 3)
+            self.assertEqual(tile.get_format(), cairo.FORMAT_A8)
+            tile_stride = tile.get_stride()
+            tile.flush()
+            np.testing.assert_array_equal(
+                np.ndarray((3, 8), np.uint8, tile.get_data(), strides=(tile_stride, 1)),
+                a8_pixels[:3, x : x + 8],
+            )
+
+    def test_grayscale_saturated_pixels(self):
+        import numpy as np
+
+        # opaque primaries and white, where 8-bit products would overflow
+        colors = [(1, 0, 0), (0, 1, 0), (0, 0, 1), (1, 1, 1), (1, 1, 0)]
+        surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, len(colors), 1)
+        ctx = cairo.Context(surface)
+        for x, (r, g, b) in enumerate(colors):
+            ctx.set_source_rgb(r, g, b)
+            ctx.rectangle(x, 0, 1, 1)
+            ctx.fill()
+
+        gray = cs.surface_to_grayscale(surface)
+        expected = [255 * (0.299 * r + 0.587 * g + 0.114 * b) for r, g, b in colors]
+        np.testing.assert_allclose(gray[0].astype(float), expected, atol=1)
+
+        # arrays and surfaces encode to the same type
+        self.assertIsInstance(cs.pgm_bytes(surface), bytearray)
+        self.assertIsInstance(cs.pgm_bytes(gray), bytearray)
+        self.assertEqual(cs.pgm_bytes(gray), cs.pgm_bytes(surface))
+
+    def test_cairo_engine_matches_pil_engine(self):
+        import numpy as np
+        from unittest import mock
+
+        def grayscale(char, engine):
+            tile = cs.stack_surfaces(
+                cs.create_blank(cairo.FORMAT_ARGB32, cs.TILE_WIDTH, cs.TILE_HEIGHT),
+                cs.draw_character(char, engine=engine, use_cache=False),
+            )
+            return cs.surface_to_grayscale(tile).astype(np.int16)
+
+        # hinting and antialiasing differ, so agree within a tolerance:
+        # about the same amount of ink, in about the same place
+        for char in "はにの":
+            pil, native = grayscale(char, "pil"), grayscale(char, "cairo")
+            pil_ink, native_ink = (255 - pil).sum(), (255 - native).sum()
+            self.assertLess(abs(pil_ink - native_ink) / pil_ink, 0.1)
+            for a, b in zip(
+                cs.find_tight_bounding_box(pil.astype(np.uint8)),
+                cs.find_tight_bounding_box(native.astype(np.uint8)),
+            ):
+                self.assertLessEqual(abs(a - b), 3)
+
+        # a family fontconfig would substitute is drawn with PIL instead
+        with mock.patch.object(cs, "_cairo_resolves_font", return_value=False):
+            self.assertEqual(
+                grayscale("は", "cairo").tolist(), grayscale("は", "pil").tolist()
+            )
+
+    def test_font_lock(self):
+        lock = cs.font_lock(cs.FONT_PATH, 72)
+        self.assertIs(cs.font_lock(cs.FONT_PATH, 72), lock)
+        self.assertIsNot(cs.font_lock(cs.FONT_PATH, 36), lock)
+
+        # held only while a glyph is rasterized
+        cs.draw_character("は", 72, use_cache=False)
+        self.assertFalse(lock.locked())
+
+    def test_slack_buffer(self):
+        stride, height = 40, 3
+        buffer = cs._slack_buffer(stride, height)
+        self.assertEqual(len(buffer), (height + 1) * stride)
+        self.assertFalse(buffer[height * stride :].any())
+        self.assertFalse(cs._slack_buffer(stride, height, clear=True).any())
+
+        # line surfaces start out transparent
+        surface = cs.create_line_surface(30, 10)
+        self.assertFalse(cs.surface_array(surface).any())
+
+    def test_ocr_batch_cancel(self):
+        import os
+        import tempfile
+        import threading
+        from unittest import mock
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            log = os.path.join(tmpdir, "calls.log")
+            stub = write_stub_nhocr(
+                tmpdir,
+                f"echo call >> {log}\n"
+                "printf 'IMG\\t0\\nR\\t1\\tに\\t0\\t0\\t1.0\\n'\n",
+            )
+            tiles = [cs.render_string(c) for c in "にのは"]
+            cancel = threading.Event()
+
+            # cancelled after the first reading: the other tiles never run
+            with mock.patch.object(cs, "NHOCR_COMMAND", stub), mock.patch.object(
+                cs, "OCR_CACHE", cs.OcrCache()
+            ):
+                results = cs.ocr_batch(
+                    tiles,
+                    max_workers=1,
+                    images_per_process=1,
+                    callback=lambda i, result: cancel.set(),
+                    cancel=cancel,
+                )
+            with open(log) as f:
+                calls = f.read().split()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results[0].text, "に")
+        self.assertEqual(results[1:], [cs.OcrResult(None, "cancelled")] * 2)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,270 @@
+"""
+Opt-in timing spans for the char_surface pipeline and the GUI handlers.
+
+Nothing is instrumented until enable_tracing() is called (draw.py calls
+it when the SHUJI_TRACE environment variable is set), so disabled
+tracing costs nothing: the stages are swapped for timed wrappers while
+tracing is on, and swapped back by disable_tracing().
+
+    SHUJI_TRACE=trace.json python3 draw.py
+
+The spans can be written as Chrome trace JSON (chrome://tracing or
+ui.perfetto.dev) and summarized per stage.
+"""
+
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import char_surface as cs
+
+TRACE_ENV = "SHUJI_TRACE"
+TRACE_FILE = "shuji_trace.json"  # written when SHUJI_TRACE is just a flag
+
+# char_surface stages wrapped by enable_tracing(); absent names are skipped
+CS_STAGES = [
+    "draw_character",
+    "_rasterize_character",
+    "_rasterize_character_cairo",
+    "render_string",
+    "composite_tiles",
+    "apply_guides",
+    "extract_rectangle",
+    "white_pixels_match",
+    "surface_to_grayscale",
+    "surface_to_pgm",
+    "pgm_bytes",
+    "_ocr_input",
+    "_recognize",
+    "_run_nhocr",
+    "_run_nhocr_many",
+    "_run_nhocr_async",
+    "_recognize_async",
+    "parse_nhocr_output",
+    "_ocr_result",
+    "a8_to_inverted_argb32",
+    "read_pgm",
+    "_pgm_to_inverted_argb32",
+    "_fallback_tiles",
+    "ocr",
+    "ocr_by_index",
+    "ocr_tiles",
+    "ocr_batch",
+    "ocr_async",
+    "ocr_batch_async",
+    "find_tight_bounding_box",
+    "paint_grayscale_to_green",
+]
+
+
+class Tracer:
+    """
+    Thread-safe recorder of named timing spans.
+    """
+
+    def __init__(self):
+        self.spans = []  # (name, start ns, duration ns, thread id)
+        self._lock = threading.Lock()
+
+    def record(self, name, start, duration):
+        with self._lock:
+            self.spans.append((name, start, duration, threading.get_ident()))
+
+    @contextmanager
+    def span(self, name):
+        """
+        Time the body of a with-block as one span.
+
+        :param name: stage name the span is reported under
+        """
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            self.record(name, start, time.perf_counter_ns() - start)
+
+    def wrap(self, function, name):
+        """
+        Return function wrapped so every call is recorded as a span.
+
+        Coroutine functions are timed until they finish, and context
+        manager factories (such as char_surface._ocr_input) around their
+        set-up and tear-down, not the body of the with-block.
+
+        :param function: function to time
+        :param name: stage name the spans are reported under
+        """
+        if inspect.iscoroutinefunction(function):
+
+            @functools.wraps(function)
+            async def timed(*args, **kwargs):
+                with self.span(name):
+                    return await function(*args, **kwargs)
+
+        elif function is not inspect.unwrap(function) and (
+            inspect.isgeneratorfunction(inspect.unwrap(function))
+        ):
+
+            @functools.wraps(function)
+            @contextmanager
+            def timed(*args, **kwargs):
+                manager = function(*args, **kwargs)
+                with self.span(name):
+                    value = manager.__enter__()
+                try:
+                    yield value
+                except BaseException as e:
+                    with self.span(name):
+                        if not manager.__exit__(type(e), e, e.__traceback__):
+                            raise
+                else:
+                    with self.span(name):
+                        manager.__exit__(None, None, None)
+
+        else:
+
+            @functools.wraps(function)
+            def timed(*args, **kwargs):
+                with self.span(name):
+                    return function(*args, **kwargs)
+
+        timed.__traced__ = function
+        return timed
+
+    def clear(self):
+        with self._lock:
+            self.spans = []
+
+    def chrome_trace(self):
+        """
+        Return the spans as a Chrome trace event dict.
+        """
+        pid = os.getpid()
+        with self._lock:
+            spans = list(self.spans)
+        return {
+            "displayTimeUnit": "ms",
+            "traceEvents": [
+                {
+                    "name": name,
+                    "cat": name.partition(".")[0] if "." in name else "char_surface",
+                    "ph": "X",
+                    "ts": start / 1000,
+                    "dur": duration / 1000,
+                    "pid": pid,
+                    "tid": tid,
+                }
+                for name, start, duration, tid in spans
+            ],
+        }
+
+    def dump(self, path):
+        """
+        Write the spans as Chrome trace JSON.
+
+        :param path: file to write
+        """
+        with open(path, "w") as f:
+            json.dump(self.chrome_trace(), f)
+
+    def summary(self):
+        """
+        Return per-stage totals, slowest total first, as a list of
+        (name, calls, total ms, mean ms, max ms) tuples.
+        """
+        stages = {}
+        with self._lock:
+            for name, _, duration, _ in self.spans:
+                stages.setdefault(name, []).append(duration / 1e6)
+        rows = [
+            (name, len(ms), sum(ms), sum(ms) / len(ms), max(ms))
+            for name, ms in stages.items()
+        ]
+        return sorted(rows, key=lambda row: row[2], reverse=True)
+
+    def format_summary(self):
+        """
+        Return summary() as a printable table.
+        """
+        lines = [
+            f"{'stage':36} {'calls':>7} {'total ms':>10} {'mean ms':>9} {'max ms':>9}"
+        ]
+        for name, calls, total, mean, longest in self.summary():
+            lines.append(
+                f"{name:36} {calls:7d} {total:10.2f} {mean:9.3f} {longest:9.3f}"
+            )
+        return "\n".join(lines)
+
+
+TRACER = Tracer()
+_ORIGINALS = []  # (owner, attribute, original) of everything wrapped
+
+
+def instrument(owner, names, prefix=None):
+    """
+    Wrap the named functions or methods of a module or class in spans.
+
+    Only takes effect for lookups made afterwards: GUI handlers must be
+    instrumented before their signals are connected.
+
+    :param owner: module or class holding the functions
+    :param names: attribute names to wrap; missing ones are skipped
+    :param prefix: prepended to span names as "prefix.name"
+    """
+    for name in names:
+        original = owner.__dict__.get(name)
+        if original is None or hasattr(original, "__traced__"):
+            continue
+        span_name = f"{prefix}.{name}" if prefix else name
+        setattr(owner, name, TRACER.wrap(original, span_name))
+        _ORIGINALS.append((owner, name, original))
+
+
+def enable_tracing():
+    """
+    Start recording spans for the char_surface stages, returning TRACER.
+    """
+    instrument(cs, CS_STAGES)
+    for backend in (cs.NhocrBackend, cs.InProcessBackend, cs.TemplateBackend):
+        instrument(backend, ["recognize", "recognize_many"], backend.__name__)
+    return TRACER
+
+
+def disable_tracing():
+    """
+    Put back every function wrapped since tracing was enabled.
+    """
+    while _ORIGINALS:
+        owner, name, original = _ORIGINALS.pop()
+        setattr(owner, name, original)
+
+
+def tracing_enabled():
+    return bool(_ORIGINALS)
+
+
+def enable_from_env():
+    """
+    Enable tracing if SHUJI_TRACE is set, returning whether it was.
+    """
+    if os.environ.get(TRACE_ENV, "0") != "0":
+        enable_tracing()
+        return True
+    return False
+
+
+def report():
+    """
+    Write the trace to the file SHUJI_TRACE names (TRACE_FILE if it is
+    only a flag) and print the per-stage summary.
+    """
+    path = os.environ.get(TRACE_ENV, "")
+    if path in ("", "0", "1"):
+        path = TRACE_FILE
+    TRACER.dump(path)
+    print(TRACER.format_summary())
+    print(f"trace written to {path}")